@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Mapping, Optional
+
+from app.cache import StaleWhileRevalidateCache
+from app.content import EMPTY_CONFIG, ConfigRegistry, QuizContent, base_sheet_name, build_content, content_sheet_names
+from app.backends import ContentBackend, SnapshotBackend
+from app.metrics import timed_sheets_call
+from app.snapshot import load_snapshot, save_snapshot
+
+
+class AsyncSheetsDB:
+    """Асинхронный фасад над источником контента (UnifiedGoogleSheetsDB или локальной копией листов).
+
+    Синхронные вызовы gspread выполняются в ограниченном пуле потоков, чтобы не
+    блокировать event loop. Одинаковые одновременные запросы разделяют один вызов.
+    Контент викторины загружается целиком одним запросом и отдается из индексов в памяти;
+    листы обновляются в фоне по stale-while-revalidate с интервалом на каждый лист.
+
+    Конструктор не обращается ни к сети, ни к диску: подключение и первая загрузка
+    выполняются в warm_up (в startup-хуке бота) с повторами, а до ее завершения
+    ready=False. Если задан snapshot_path, последний успешно загруженный контент хранится
+    на диске: при старте бот сразу отвечает по снимку, а при недоступности Google Sheets
+    продолжает работать на нем.
+    """
+
+    def __init__(self, db_factory: Callable[[], ContentBackend], max_workers: int = 4,
+                 refresh_intervals: Optional[Mapping[str, float]] = None,
+                 snapshot_path: Optional[str] = None):
+        self._db_factory = db_factory
+        self._db = None
+        self._connect_lock = threading.Lock()
+        self._snapshot_path = snapshot_path
+        self._background_tasks = set()
+        self._sheet_names = tuple(content_sheet_names())
+        # Интервалы задаются по базовому имени листа: Config, Questions, Answers, Archetypes
+        refresh_intervals = refresh_intervals or {}
+        sheet_intervals = {
+            name: refresh_intervals[base_sheet_name(name)]
+            for name in self._sheet_names if base_sheet_name(name) in refresh_intervals
+        }
+        self._cache = StaleWhileRevalidateCache(self._load_sheets, sheet_intervals)
+        self._content = None
+        self._content_version = None
+        self._snapshot_version = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gsheets")
+        self._in_flight = {}
+        self._snapshot_loaded = False
+        # Ревизия источника, которой соответствует контент в кэше, и ревизия после нашей
+        # последней записи (результаты в той же таблице тоже меняют ее modifiedTime)
+        self._revision = None
+        self._own_revision = None
+        self.change_checks = 0
+        self.change_reloads = 0
+        logging.info(f"AsyncSheetsDB: пул из {max_workers} потоков для запросов к Google Sheets")
+
+    def follow_snapshot(self):
+        """Режим воркера-читателя: контент берется из снимка, который сохраняет воркер 0.
+
+        Вызывается до прогрева. Этот процесс не обращается к источнику и не перезаписывает снимок.
+        """
+        if not self._snapshot_path:
+            raise ValueError("Для чтения снимка контента нужен snapshot_path")
+        self._db_factory = partial(SnapshotBackend, self._snapshot_path)
+        self._snapshot_path = None
+
+    @property
+    def ready(self) -> bool:
+        """Контент загружен (из источника или снимка) и хендлеры могут отвечать"""
+        return self._content is not None
+
+    async def _load_snapshot(self):
+        """Заполняет кэш из снимка на диске; выполняется один раз при прогреве"""
+        if self._snapshot_loaded:
+            return
+        self._snapshot_loaded = True
+        snapshot = await asyncio.get_running_loop().run_in_executor(
+            self._executor, load_snapshot, self._snapshot_path)
+        if snapshot:
+            # Снимок сразу считается устаревшим: первое обращение запустит фоновое обновление
+            self._cache.prime({name: snapshot[name] for name in self._sheet_names if name in snapshot})
+
+    async def warm_up(self, retry_delay: float = 1, max_retry_delay: float = 60):
+        """Подключается к источнику и загружает контент, повторяя попытки с растущей паузой.
+
+        Все листы обоих полов загружаются одним пакетным запросом, индексы и шаблоны
+        вопросов строятся сразу, чтобы первый пользователь не ждал.
+        """
+        await self._load_snapshot()
+        delay = retry_delay
+        while await self.content() is None:
+            logging.warning(f"Контент еще не загружен, повтор через {delay:g} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_delay)
+        logging.info("AsyncSheetsDB: контент загружен, бот готов отвечать")
+
+    async def check_for_changes(self) -> bool:
+        """Сверяет признак изменения источника и подменяет только изменившиеся листы.
+
+        Если источник не изменился, срок всех листов продлевается: плановое обновление по
+        интервалу не нужно. Если изменился - листы загружаются одним пакетным запросом
+        (отдельной ревизии листа Sheets API не дает), а в кэш попадают только листы с
+        другим содержимым. Возвращает True, если контент изменился.
+        """
+        revision = await self._call('revision')
+        self.change_checks += 1
+        if revision is None:
+            # Источник не умеет сообщать об изменениях - работают интервалы обновления
+            return False
+        if revision == self._revision:
+            self._cache.extend(self._sheet_names)
+            return False
+        if revision == self._own_revision:
+            # Источник изменила только наша запись. Срок листов не продлеваем: правку контента,
+            # сделанную незадолго до записи, подхватит плановое обновление по интервалу
+            return False
+        values = await self._fetch_sheets(self._sheet_names)
+        self._revision = revision
+        changed = {name: rows for name, rows in values.items() if rows != self._cache.peek(name)}
+        self._cache.extend(self._sheet_names)
+        if not changed:
+            return False
+        logging.info(f"Обнаружены изменения в листах {sorted(changed)}, обновляем контент")
+        self.change_reloads += 1
+        self._cache.put(changed)
+        # Индексы пересобираются сразу, а не в первом хендлере после изменения
+        await self.content()
+        return True
+
+    async def watch_changes(self, interval: float):
+        """Периодически проверяет источник на изменения (после загрузки контента)"""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.ready:
+                continue
+            try:
+                await self.check_for_changes()
+            except Exception as e:
+                logging.error(f"Не удалось проверить изменения контента: {e}")
+
+    def start_watching(self, interval: float) -> asyncio.Task:
+        task = asyncio.ensure_future(self.watch_changes(interval))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def watch_stats(self) -> dict:
+        return {'checks': self.change_checks, 'reloads': self.change_reloads}
+
+    def start_warm_up(self, retry_delay: float = 1, max_retry_delay: float = 60) -> asyncio.Task:
+        """Запускает прогрев в фоне: бот принимает апдейты, пока контент загружается"""
+        task = asyncio.ensure_future(self.warm_up(retry_delay, max_retry_delay))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    @property
+    def sync_db(self) -> Optional[ContentBackend]:
+        """Синхронный экземпляр БД (None, пока подключение не установлено)"""
+        return self._db
+
+    def _connect(self) -> ContentBackend:
+        """Создает подключение к Google Sheets при первом обращении (выполняется в пуле потоков)"""
+        if self._db is None:
+            with self._connect_lock:
+                if self._db is None:
+                    self._db = self._db_factory()
+        return self._db
+
+    def _invoke(self, method_name: str, *args):
+        with timed_sheets_call(method_name):
+            return getattr(self._connect(), method_name)(*args)
+
+    async def _call(self, method_name: str, *args):
+        """Выполняет метод БД в пуле потоков, объединяя одинаковые одновременные вызовы"""
+        key = (method_name, args)
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, partial(self._invoke, method_name, *args))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            logging.debug(f"Запрос {method_name}{args} уже выполняется, ожидаем его результат")
+        # shield: отмена одного ожидающего хендлера не должна отменять общий вызов
+        return await asyncio.shield(future)
+
+    async def append_rows(self, sheet_name: str, rows: list, header: Optional[list] = None):
+        """Дописывает строки в лист в пуле потоков (записи не объединяются, в отличие от _call)"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, partial(self._invoke, 'append_rows', sheet_name, rows, header))
+        if self._revision is not None:
+            # Ревизия сразу после своей записи: наблюдатель не будет из-за нее перечитывать контент.
+            # Вызов не объединяется с проверкой наблюдателя, начатой до записи
+            self._own_revision = await loop.run_in_executor(self._executor, partial(self._invoke, 'revision'))
+
+    @property
+    def cache(self) -> StaleWhileRevalidateCache:
+        return self._cache
+
+    async def _fetch_sheets(self, sheet_names: tuple) -> dict:
+        return await self._call('fetch_values', sheet_names)
+
+    async def _load_sheets(self, sheet_names: tuple) -> dict:
+        """Загрузчик кэша: полная загрузка запоминает ревизию источника, снятую до чтения листов.
+
+        Поэтому первая проверка изменений после прогрева не перечитывает все листы заново.
+        """
+        if set(sheet_names) != set(self._sheet_names):
+            return await self._fetch_sheets(sheet_names)
+        try:
+            revision = await self._call('revision')
+        except Exception as e:
+            logging.warning(f"Не удалось получить ревизию источника контента: {e}")
+            revision = None
+        values = await self._fetch_sheets(sheet_names)
+        if revision is not None:
+            self._revision = revision
+        return values
+
+    async def content(self) -> Optional[QuizContent]:
+        """Актуальный снимок контента; пересобирается только после обновления листов"""
+        try:
+            values = await self._cache.get_many(self._sheet_names)
+        except Exception as e:
+            logging.error(f"Не удалось загрузить контент викторины: {e}")
+            return self._content
+        if self._cache.version != self._content_version:
+            self._content = build_content(values)
+            self._content_version = self._cache.version
+            if self._snapshot_path and self._cache.loaded_version > self._snapshot_version:
+                self._snapshot_version = self._cache.loaded_version
+                self._save_snapshot(values)
+        return self._content
+
+    def _save_snapshot(self, values: dict):
+        """Сохраняет снимок на диск в пуле потоков, не задерживая хендлер"""
+        async def save():
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, save_snapshot, self._snapshot_path, dict(values)
+                )
+            except Exception as e:
+                logging.error(f"Не удалось сохранить снимок контента: {e}")
+
+        task = asyncio.ensure_future(save())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def config(self) -> ConfigRegistry:
+        """Реестр значений листа Config (пустой, если контент еще не загружен)"""
+        content = await self.content()
+        if content is None:
+            return EMPTY_CONFIG
+        return content.config
+
+    async def get_config_value(self, key):
+        return (await self.config()).get(key)
+
+    async def get_question(self, question_id, user_gender="female"):
+        content = await self.content()
+        if content is None:
+            return None
+        return content.for_gender(user_gender).questions.get(question_id)
+
+    async def get_answers(self, question_id, user_gender="female"):
+        content = await self.content()
+        if content is None:
+            return ()
+        return content.for_gender(user_gender).answers_by_question.get(question_id, ())
+
+    async def get_answer(self, answer_id, user_gender="female"):
+        content = await self.content()
+        if content is None:
+            return None
+        return content.for_gender(user_gender).answers.get(answer_id)
+
+    async def get_question_template(self, question_id, user_gender="female"):
+        content = await self.content()
+        if content is None:
+            return None
+        return content.for_gender(user_gender).templates.get(question_id)
+
+    async def get_archetype_result(self, archetype_id, user_gender="female"):
+        content = await self.content()
+        if content is None:
+            return None
+        return content.for_gender(user_gender).archetypes.get(archetype_id)
+
+    async def get_all_archetypes(self, user_gender="female"):
+        content = await self.content()
+        if content is None:
+            return ()
+        return content.for_gender(user_gender).archetype_list
+
+    def close(self):
+        """Останавливает прогрев и пул потоков"""
+        for task in self._background_tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,263 @@
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.quota import SheetsQuota
+from app.snapshot import load_snapshot
+
+# Поддерживаемые значения CONTENT_BACKEND
+BACKEND_KINDS = ("sheets", "file", "sqlite")
+
+
+class ContentBackend(ABC):
+    """Источник значений листов объединенной таблицы.
+
+    Реализации: UnifiedGoogleSheetsDB (живая таблица) и локальные копии тех же листов
+    ниже. Обязательны fetch_values и append_rows, write_values нужен только для экспорта.
+    Значения - списки строк, как их возвращает values_batch_get.
+    """
+
+    @abstractmethod
+    def fetch_values(self, sheet_names: Iterable[str]) -> Dict[str, List[list]]:
+        """Значения листов одним запросом: {лист: строки}"""
+
+    @abstractmethod
+    def append_rows(self, sheet_name: str, rows: list, header: Optional[list] = None):
+        """Дописывает строки в конец листа (header - заголовок для нового листа)"""
+
+    def write_values(self, values: Dict[str, List[list]]):
+        """Полностью заменяет содержимое листов (используется при экспорте из Google Sheets)"""
+        raise NotImplementedError
+
+    def revision(self) -> Optional[str]:
+        """Дешевый признак изменения источника (меняется при любой правке) или None, если его нет"""
+        return None
+
+
+class FileBackend(ContentBackend):
+    """Листы в каталоге: <лист>.json (список строк) или <лист>.csv.
+
+    Файл перечитывается только после изменения, поэтому периодическое обновление
+    контента почти ничего не стоит, а правки файлов подхватываются без перезапуска.
+    """
+
+    def __init__(self, path: str, export_format: str = "csv"):
+        if not os.path.isdir(path):
+            raise ValueError(f"Каталог с контентом не найден: {path}")
+        self.path = path
+        self.export_format = export_format
+        self._cache: Dict[str, tuple] = {}
+        # Файлы листов, которые бот дописывает сам (Results.csv), не считаются изменением контента
+        self._appended_files = set()
+        self._lock = threading.Lock()
+        logging.info(f"Контент читается из каталога {path}")
+
+    def _sheet_file(self, sheet_name: str) -> Optional[str]:
+        for extension in ("json", "csv"):
+            file_path = os.path.join(self.path, f"{sheet_name}.{extension}")
+            if os.path.exists(file_path):
+                return file_path
+        return None
+
+    @staticmethod
+    def _read_file(file_path: str) -> List[list]:
+        if file_path.endswith(".json"):
+            with open(file_path, encoding="utf-8") as f:
+                return [[str(cell) for cell in row] for row in json.load(f)]
+        with open(file_path, encoding="utf-8", newline="") as f:
+            return [row for row in csv.reader(f)]
+
+    def _read_sheet(self, sheet_name: str) -> List[list]:
+        file_path = self._sheet_file(sheet_name)
+        if file_path is None:
+            logging.warning(f"Файл листа '{sheet_name}' не найден в {self.path}")
+            return []
+        stat = os.stat(file_path)
+        signature = (file_path, stat.st_mtime_ns, stat.st_size)
+        cached = self._cache.get(sheet_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        rows = self._read_file(file_path)
+        self._cache[sheet_name] = (signature, rows)
+        return rows
+
+    def fetch_values(self, sheet_names: Iterable[str]) -> Dict[str, List[list]]:
+        with self._lock:
+            return {name: self._read_sheet(name) for name in sheet_names}
+
+    def revision(self) -> Optional[str]:
+        signatures = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.endswith((".json", ".csv")) and entry.name not in self._appended_files:
+                    stat = entry.stat()
+                    signatures.append(f"{entry.name}:{stat.st_mtime_ns}:{stat.st_size}")
+        return "|".join(sorted(signatures))
+
+    def append_rows(self, sheet_name: str, rows: list, header: Optional[list] = None):
+        file_path = os.path.join(self.path, f"{sheet_name}.csv")
+        with self._lock:
+            self._appended_files.add(os.path.basename(file_path))
+            is_new = not os.path.exists(file_path)
+            with open(file_path, "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                if is_new and header:
+                    writer.writerow(header)
+                writer.writerows(rows)
+
+    def write_values(self, values: Dict[str, List[list]]):
+        with self._lock:
+            for sheet_name, rows in values.items():
+                file_path = os.path.join(self.path, f"{sheet_name}.{self.export_format}")
+                tmp_path = f"{file_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                    if self.export_format == "json":
+                        json.dump(rows, f, ensure_ascii=False, indent=1)
+                    else:
+                        csv.writer(f).writerows(rows)
+                os.replace(tmp_path, file_path)
+                # Файл другого формата перекрывал бы новый экспорт
+                for extension in ("json", "csv"):
+                    stale_path = os.path.join(self.path, f"{sheet_name}.{extension}")
+                    if extension != self.export_format and os.path.exists(stale_path):
+                        os.remove(stale_path)
+            self._cache.clear()
+
+
+class SQLiteBackend(ContentBackend):
+    """Листы в файле SQLite: строка листа - запись с ключом (sheet, row_num)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sheet_rows ("
+            "sheet TEXT NOT NULL, row_num INTEGER NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (sheet, row_num)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+        logging.info(f"Контент читается из SQLite: {path}")
+
+    def fetch_values(self, sheet_names: Iterable[str]) -> Dict[str, List[list]]:
+        values = {}
+        with self._lock:
+            for name in sheet_names:
+                cursor = self._connection.execute(
+                    "SELECT data FROM sheet_rows WHERE sheet = ? ORDER BY row_num", (name,))
+                values[name] = [json.loads(data) for (data,) in cursor]
+        return values
+
+    def append_rows(self, sheet_name: str, rows: list, header: Optional[list] = None):
+        with self._lock, self._connection:
+            (last,) = self._connection.execute(
+                "SELECT MAX(row_num) FROM sheet_rows WHERE sheet = ?", (sheet_name,)).fetchone()
+            if last is None and header:
+                rows = [header] + list(rows)
+            start = 0 if last is None else last + 1
+            self._connection.executemany(
+                "INSERT INTO sheet_rows (sheet, row_num, data) VALUES (?, ?, ?)",
+                [(sheet_name, start + index, _dumps_row(row)) for index, row in enumerate(rows)],
+            )
+
+    def write_values(self, values: Dict[str, List[list]]):
+        with self._lock, self._connection:
+            for sheet_name, rows in values.items():
+                self._connection.execute("DELETE FROM sheet_rows WHERE sheet = ?", (sheet_name,))
+                self._connection.executemany(
+                    "INSERT INTO sheet_rows (sheet, row_num, data) VALUES (?, ?, ?)",
+                    [(sheet_name, index, _dumps_row(row)) for index, row in enumerate(rows)],
+                )
+
+    def revision(self) -> Optional[str]:
+        # data_version меняется после записи из другого соединения (например, export_content.py)
+        with self._lock:
+            (data_version,) = self._connection.execute("PRAGMA data_version").fetchone()
+        return str(data_version)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SnapshotBackend(ContentBackend):
+    """Контент из снимка, который сохраняет другой процесс (воркер 0 в режиме воркеров).
+
+    Снимок перечитывается только после изменения файла, ревизия - его mtime и размер,
+    поэтому отслеживание изменений не тратит квоту Google Sheets. Результаты такой
+    процесс в таблицу не пишет: их передает воркеру 0 ResultsForwarder.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cached = None
+        self._lock = threading.Lock()
+
+    def revision(self) -> Optional[str]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def fetch_values(self, sheet_names: Iterable[str]) -> Dict[str, List[list]]:
+        with self._lock:
+            signature = self.revision()
+            if self._cached is None or self._cached[0] != signature:
+                sheets = load_snapshot(self.path)
+                if sheets is None:
+                    raise RuntimeError(f"Снимок контента {self.path} еще не сохранен")
+                self._cached = (signature, sheets)
+            sheets = self._cached[1]
+        return {name: sheets.get(name, []) for name in sheet_names}
+
+    def append_rows(self, sheet_name: str, rows: list, header: Optional[list] = None):
+        raise RuntimeError("Снимок контента доступен только для чтения")
+
+
+def _dumps_row(row: list) -> str:
+    return json.dumps([str(cell) for cell in row], ensure_ascii=False, separators=(',', ':'))
+
+
+def content_backend_factory(kind: str, path: Optional[str] = None, credentials_path: Optional[str] = None,
+                            credentials_json: Optional[str] = None,
+                            spreadsheet_key: Optional[str] = None,
+                            quota: Optional[SheetsQuota] = None) -> Callable[[], ContentBackend]:
+    """Фабрика источника контента по настройке CONTENT_BACKEND: sheets, file или sqlite.
+
+    Источник создается при первом обращении в пуле потоков AsyncSheetsDB. quota -
+    общий учет и лимит запросов к Google Sheets API (только для sheets).
+    """
+    if kind == "file":
+        if not path:
+            raise ValueError("CONTENT_PATH не указан для CONTENT_BACKEND=file")
+        logging.info(f"Источник контента: файлы ({path})")
+        return partial(FileBackend, path)
+    if kind == "sqlite":
+        if not path:
+            raise ValueError("CONTENT_PATH не указан для CONTENT_BACKEND=sqlite")
+        logging.info(f"Источник контента: SQLite ({path})")
+        return partial(SQLiteBackend, path)
+    if kind != "sheets":
+        logging.warning(f"Неизвестный источник контента '{kind}', используем sheets")
+    logging.info("Источник контента: Google Sheets")
+    return partial(
+        _connect_google_sheets,
+        credentials_path=credentials_path,
+        credentials_json=credentials_json,
+        spreadsheet_key=spreadsheet_key,
+        quota=quota,
+    )
+
+
+def _connect_google_sheets(**kwargs) -> ContentBackend:
+    # gspread и google-auth импортируются при подключении, а не при импорте хендлеров
+    from app.gsheets import UnifiedGoogleSheetsDB
+    return UnifiedGoogleSheetsDB(**kwargs)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Mapping
+
+# Пауза перед повторной попыткой, если фоновое обновление завершилось ошибкой
+REFRESH_RETRY_DELAY = 30
+
+
+class StaleWhileRevalidateCache:
+    """Кэш, который после истечения интервала продолжает отдавать последнее значение.
+
+    Устаревшие ключи обновляются в фоне, не более одного обновления на ключ
+    одновременно. Промахи (ключа еще нет в кэше) загружаются одним вызовом loader.
+    """
+
+    def __init__(self, loader: Callable[[tuple], Awaitable[Dict[str, object]]],
+                 refresh_intervals: Mapping[str, float], default_interval: float = 300):
+        self._loader = loader
+        self._refresh_intervals = dict(refresh_intervals)
+        self._default_interval = default_interval
+        self._values = {}
+        self._expires_at = {}
+        self._refreshing = set()
+        self._loading = {}
+        self._tasks = set()
+        # Увеличивается при каждом сохранении нового значения (повторная загрузка тех же данных не в счет)
+        self.version = 0
+        # Версия последнего значения, полученного через loader (а не через prime)
+        self.loaded_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _interval(self, key: str) -> float:
+        return self._refresh_intervals.get(key, self._default_interval)
+
+    def _store(self, values: Mapping[str, object]) -> bool:
+        """Сохраняет загруженные значения и продлевает их срок; возвращает, изменилось ли что-то"""
+        now = time.monotonic()
+        changed = False
+        for key, value in values.items():
+            if key not in self._values or self._values[key] != value:
+                self._values[key] = value
+                changed = True
+            self._expires_at[key] = now + self._interval(key)
+        if changed:
+            self.version += 1
+            self.loaded_version = self.version
+        return changed
+
+    def prime(self, values: Mapping[str, object]):
+        """Заполняет кэш заранее известными значениями, которые сразу считаются устаревшими"""
+        now = time.monotonic()
+        for key, value in values.items():
+            self._values[key] = value
+            self._expires_at[key] = now
+        self.version += 1
+
+    def put(self, values: Mapping[str, object]) -> bool:
+        """Сохраняет значения, полученные в обход loader (например, при обнаружении изменений)"""
+        return self._store(values)
+
+    def peek(self, key: str, default=None):
+        """Текущее значение ключа без учета срока и без обновления"""
+        return self._values.get(key, default)
+
+    def extend(self, keys: Iterable[str]):
+        """Продлевает срок значений, актуальность которых подтверждена без загрузки"""
+        now = time.monotonic()
+        for key in keys:
+            if key in self._values:
+                self._expires_at[key] = now + self._interval(key)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        """Возвращает значения ключей; устаревшие ключи обновляются в фоне"""
+        keys = tuple(keys)
+        now = time.monotonic()
+        missing = tuple(key for key in keys if key not in self._values)
+        stale = tuple(
+            key for key in keys
+            if key in self._values and self._expires_at[key] <= now and key not in self._refreshing
+        )
+        self.hits += len(keys) - len(missing)
+
+        if stale:
+            self._schedule_refresh(stale)
+        if missing:
+            self.misses += len(missing)
+            await self._load_missing(missing)
+
+        return {key: self._values[key] for key in keys if key in self._values}
+
+    async def _load_missing(self, keys: tuple):
+        """Загружает отсутствующие ключи; одновременные промахи ждут одну загрузку"""
+        to_load = tuple(key for key in keys if key not in self._loading)
+        if to_load:
+            future = asyncio.ensure_future(self._load_and_store(to_load))
+            for key in to_load:
+                self._loading[key] = future
+        for future in {self._loading[key] for key in keys}:
+            await asyncio.shield(future)
+
+    async def _load_and_store(self, keys: tuple):
+        try:
+            self._store(await self._loader(keys))
+        finally:
+            for key in keys:
+                self._loading.pop(key, None)
+
+    def _schedule_refresh(self, keys: tuple):
+        self._refreshing.update(keys)
+        task = asyncio.ensure_future(self._refresh(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, keys: tuple):
+        try:
+            changed = self._store(await self._loader(keys))
+            self.refreshes += 1
+            logging.info(f"Фоновое обновление листов {list(keys)} завершено"
+                         f"{'' if changed else ' (без изменений)'}")
+        except Exception as e:
+            self.refresh_errors += 1
+            retry_at = time.monotonic() + REFRESH_RETRY_DELAY
+            for key in keys:
+                self._expires_at[key] = min(retry_at, time.monotonic() + self._interval(key))
+            logging.error(f"Ошибка фонового обновления листов {list(keys)}, отдаем прежние данные: {e}")
+        finally:
+            self._refreshing.difference_update(keys)
+
+    def stats(self) -> dict:
+        """Счетчики попаданий, промахов и фоновых обновлений"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'refreshing': len(self._refreshing),
+        }
@@ -0,0 +1,294 @@
+import html
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from html.parser import HTMLParser
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+SUPPORTED_GENDERS = ("female", "male")
+
+# Базовые названия листов с контентом викторины (к ним добавляется суффикс пола)
+CONTENT_SHEETS = ("Questions", "Answers", "Archetypes")
+
+CONFIG_SHEET = "Config"
+
+# Обязательные ключи листа Config
+BASIC_CONFIG_KEYS = ('welcome_sequence_1', 'welcome_sequence_2', 'promo_sequence', 'promo_button_text', 'start_button_text')
+FINAL_CONFIG_KEYS = ('final_cta_text', 'final_cta_button', 'final_proposition', 'final_pdf_url', 'final_video_url', 'payment_url')
+REQUIRED_CONFIG_KEYS = BASIC_CONFIG_KEYS + FINAL_CONFIG_KEYS
+
+
+def gender_sheet_name(base_name: str, user_gender: str) -> str:
+    """Возвращает название листа для пола: Questions + female -> Questions_Female"""
+    suffix = "Male" if user_gender == "male" else "Female"
+    return f"{base_name}_{suffix}"
+
+
+def base_sheet_name(sheet_name: str) -> str:
+    """Questions_Female -> Questions, Config -> Config"""
+    base, _, suffix = sheet_name.rpartition('_')
+    return base if suffix in ("Female", "Male") else sheet_name
+
+
+def content_sheet_names() -> List[str]:
+    """Все листы с контентом викторины для обоих полов плюс общий Config"""
+    names = [gender_sheet_name(base, gender) for gender in SUPPORTED_GENDERS for base in CONTENT_SHEETS]
+    return names + [CONFIG_SHEET]
+
+
+def _to_int(value):
+    """Приводит числовые строки к int так же, как это делает gspread.get_all_records"""
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value.strip())
+    return value
+
+
+def _cell(row: list, index: int) -> str:
+    return row[index] if index < len(row) else ''
+
+
+# Теги, которые Telegram поддерживает в parse_mode=HTML
+TELEGRAM_HTML_TAGS = frozenset({
+    'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del', 'a', 'code', 'pre',
+    'span', 'tg-spoiler', 'tg-emoji', 'blockquote',
+})
+_BARE_AMPERSAND = re.compile(r'&(?!#?\w+;)')
+
+
+class _TelegramHTMLValidator(HTMLParser):
+    """Проверяет, что текст состоит только из поддерживаемых и сбалансированных тегов"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []
+        self.valid = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in TELEGRAM_HTML_TAGS:
+            self.valid = False
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack.pop() != tag:
+            self.valid = False
+
+    def handle_data(self, data):
+        if '<' in data or '>' in data:
+            self.valid = False
+
+
+def safe_html(text: str, context: str = '') -> str:
+    """Возвращает текст, пригодный для parse_mode=HTML.
+
+    Разметка из таблицы сохраняется, если она корректна для Telegram; иначе текст
+    экранируется целиком, чтобы сообщение не упало с ошибкой разбора.
+    """
+    validator = _TelegramHTMLValidator()
+    validator.feed(text)
+    validator.close()
+    if validator.valid and not validator.stack:
+        return _BARE_AMPERSAND.sub('&amp;', text)
+    logging.warning(f"Некорректная HTML-разметка {context}, текст будет экранирован: {text[:80]!r}")
+    return html.escape(text, quote=False)
+
+
+# Кэш отрендеренных перестановок на один шаблон вопроса
+RENDER_CACHE_SIZE = 256
+_NUMBER_PREFIXES = tuple(f"<b>{num}.</b> " for num in range(1, 33))
+
+
+class QuestionTemplate:
+    """HTML-текст вопроса, подготовленный при загрузке контента.
+
+    Между пользователями меняется только порядок ответов, поэтому рендеринг -
+    это склейка заранее экранированных фрагментов с LRU-кэшем перестановок.
+    """
+
+    def __init__(self, question: "Question", answers: tuple):
+        context = f"в вопросе {question.question_id}"
+        self.question_id = question.question_id
+        self.answer_count = len(answers)
+        self.answer_ids = tuple(answer.answer_id for answer in answers)
+        self._head = f"<b>{safe_html(question.question_text, context)}</b>\n\n"
+        self._tail = f"\n\n<i>{safe_html(question.prompt_text, context)}</i>"
+        self._fragments = tuple(safe_html(answer.answer_text, context) for answer in answers)
+        self.render = lru_cache(maxsize=RENDER_CACHE_SIZE)(self._render)
+
+    def _render(self, order: tuple) -> str:
+        """Текст вопроса для порядка ответов order (индексы в исходном списке ответов)"""
+        body = "\n\n".join([
+            (_NUMBER_PREFIXES[position] if position < len(_NUMBER_PREFIXES) else f"<b>{position + 1}.</b> ")
+            + self._fragments[index]
+            for position, index in enumerate(order)
+        ])
+        return self._head + body + self._tail
+
+
+@dataclass(frozen=True)
+class Question:
+    question_id: int
+    question_text: str
+    prompt_text: str
+
+
+@dataclass(frozen=True)
+class Answer:
+    answer_id: Union[int, str]
+    question_id: int
+    answer_text: str
+    archetype_id: str
+
+
+@dataclass(frozen=True)
+class Archetype:
+    archetype_id: str
+    main_description: str
+    secondary_description: str
+
+
+@dataclass(frozen=True)
+class GenderContent:
+    """Неизменяемый индексированный контент викторины для одного пола"""
+    questions: Mapping[int, Question]
+    answers: Mapping[Union[int, str], Answer]
+    answers_by_question: Mapping[int, Tuple[Answer, ...]]
+    archetypes: Mapping[str, Archetype]
+    # Архетипы в порядке листа (нужен для начальных баллов и тестового режима)
+    archetype_list: Tuple[Archetype, ...]
+    # Шаблоны текста вопросов, у которых есть ответы
+    templates: Mapping[int, QuestionTemplate]
+
+
+@dataclass(frozen=True)
+class ConfigRegistry:
+    """Значения листа Config, нормализованные при загрузке (\\n -> перенос строки)"""
+    values: Mapping[str, str]
+    # Обязательные ключи, которых нет в листе или у которых пустое значение
+    missing: Tuple[str, ...] = ()
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.values.get(key, default)
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.values.get(key))
+
+
+EMPTY_CONFIG = ConfigRegistry(values=MappingProxyType({}), missing=REQUIRED_CONFIG_KEYS)
+
+
+@dataclass(frozen=True)
+class QuizContent:
+    """Снимок контента викторины для обоих полов"""
+    by_gender: Mapping[str, GenderContent]
+    config: ConfigRegistry = EMPTY_CONFIG
+
+    def for_gender(self, user_gender: str) -> GenderContent:
+        """Контент для пола с fallback на female"""
+        if user_gender not in SUPPORTED_GENDERS:
+            logging.warning(f"Некорректный пол пользователя '{user_gender}', используем 'female'")
+            user_gender = "female"
+        return self.by_gender[user_gender]
+
+
+def build_questions(rows: List[list]) -> Dict[int, Question]:
+    """Строки листа Questions: question_id | question_text | prompt_text"""
+    questions = {}
+    for row in rows:
+        question_id = _to_int(_cell(row, 0))
+        if not isinstance(question_id, int):
+            continue  # заголовок или пустая строка
+        questions[question_id] = Question(question_id, _cell(row, 1), _cell(row, 2))
+    return questions
+
+
+def build_answers(rows: List[list]) -> Dict[Union[int, str], Answer]:
+    """Строки листа Answers, первая строка - заголовки (как в get_all_records)"""
+    if not rows:
+        return {}
+    header = rows[0]
+    answers = {}
+    for row in rows[1:]:
+        record = {name: _cell(row, i) for i, name in enumerate(header)}
+        answer_id = _to_int(record.get('answer_id', ''))
+        if answer_id == '':
+            continue
+        answers[answer_id] = Answer(
+            answer_id=answer_id,
+            question_id=_to_int(record.get('question_id', '')),
+            answer_text=record.get('answer_text', ''),
+            archetype_id=record.get('archetype_id', ''),
+        )
+    return answers
+
+
+def build_archetypes(rows: List[list]) -> List[Archetype]:
+    """Строки листа Archetypes: archetype_id | main_description | secondary_description"""
+    archetypes = []
+    for row in rows[1:]:
+        archetype_id = _cell(row, 0)
+        if not archetype_id:
+            continue
+        archetypes.append(Archetype(
+            archetype_id=archetype_id,
+            main_description=_cell(row, 1).replace('\\n', '\n'),
+            secondary_description=_cell(row, 2).replace('\\n', '\n'),
+        ))
+    return archetypes
+
+
+def build_config(rows: List[list]) -> ConfigRegistry:
+    """Строки листа Config: key | value. Отсутствующие обязательные ключи логируются сразу"""
+    values = {}
+    for row in rows:
+        key = _cell(row, 0).strip()
+        if key:
+            values[key] = _cell(row, 1).replace('\\n', '\n')
+    missing = tuple(key for key in REQUIRED_CONFIG_KEYS if not values.get(key))
+    if missing:
+        logging.error(f"В листе '{CONFIG_SHEET}' отсутствуют обязательные ключи: {list(missing)}")
+    return ConfigRegistry(values=MappingProxyType(values), missing=missing)
+
+
+def build_gender_content(questions_rows: List[list], answers_rows: List[list],
+                         archetypes_rows: List[list]) -> GenderContent:
+    """Строит индексы контента одного пола из значений трех листов"""
+    questions = build_questions(questions_rows)
+    answers = build_answers(answers_rows)
+    archetype_list = tuple(build_archetypes(archetypes_rows))
+
+    grouped: Dict[int, List[Answer]] = {}
+    for answer in answers.values():
+        grouped.setdefault(answer.question_id, []).append(answer)
+    answers_by_question = {qid: tuple(items) for qid, items in grouped.items()}
+
+    templates = {
+        qid: QuestionTemplate(question, answers_by_question[qid])
+        for qid, question in questions.items() if qid in answers_by_question
+    }
+
+    return GenderContent(
+        questions=MappingProxyType(questions),
+        answers=MappingProxyType(answers),
+        answers_by_question=MappingProxyType(answers_by_question),
+        archetypes=MappingProxyType({archetype.archetype_id: archetype for archetype in archetype_list}),
+        archetype_list=archetype_list,
+        templates=MappingProxyType(templates),
+    )
+
+
+def build_content(values: Mapping[str, List[list]]) -> QuizContent:
+    """Строит снимок контента из значений листов, полученных одним batch_get"""
+    by_gender = {}
+    for gender in SUPPORTED_GENDERS:
+        sheets = [values.get(gender_sheet_name(base, gender), []) for base in CONTENT_SHEETS]
+        content = build_gender_content(*sheets)
+        logging.info(
+            f"Контент ({gender}): вопросов {len(content.questions)}, "
+            f"ответов {len(content.answers)}, архетипов {len(content.archetypes)}"
+        )
+        by_gender[gender] = content
+    config = build_config(values.get(CONFIG_SHEET, []))
+    return QuizContent(by_gender=MappingProxyType(by_gender), config=config)
+
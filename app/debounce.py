@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, Message
+
+MessageKey = Tuple[int, int]
+
+
+class MarkupDebouncer:
+    """Объединяет частые изменения клавиатуры одного сообщения в одну правку.
+
+    Первое изменение откладывается на window секунд; изменения, пришедшие за это время,
+    только подменяют ожидающую клавиатуру. Когда сообщение все равно будет заменено
+    (следующий вопрос), ожидающую правку можно отменить, а перед тем как оставить
+    сообщение как есть - отправить сразу. При window <= 0 клавиатура меняется без задержки.
+    """
+
+    def __init__(self, window: float = 0.4):
+        self.window = window
+        # (chat_id, message_id) -> [сообщение, клавиатура, задача отложенной правки]
+        self._pending: Dict[MessageKey, list] = {}
+        self.scheduled = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.edits = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(message: Message) -> MessageKey:
+        return message.chat.id, message.message_id
+
+    async def schedule(self, message: Message, markup: InlineKeyboardMarkup):
+        """Показать клавиатуру: сразу или в конце окна вместе с последующими изменениями"""
+        self.scheduled += 1
+        if self.window <= 0:
+            await self._edit(message, markup)
+            return
+        key = self._key(message)
+        entry = self._pending.get(key)
+        if entry is not None:
+            self.coalesced += 1
+            entry[1] = markup
+            return
+        entry = [message, markup, None]
+        entry[2] = asyncio.create_task(self._delayed_edit(key, entry))
+        self._pending[key] = entry
+
+    def cancel(self, message: Message):
+        """Отменяет ожидающую правку: сообщение будет удалено или заменено"""
+        entry = self._pending.pop(self._key(message), None)
+        if entry is not None:
+            entry[2].cancel()
+            self.skipped += 1
+
+    async def flush(self, message: Message, markup: Optional[InlineKeyboardMarkup] = None):
+        """Сразу применяет последнюю клавиатуру (или переданную) вместо отложенной правки"""
+        entry = self._pending.pop(self._key(message), None)
+        if entry is not None:
+            entry[2].cancel()
+            markup = markup or entry[1]
+        if markup is not None:
+            await self._edit(message, markup)
+
+    async def _delayed_edit(self, key: MessageKey, entry: list):
+        await asyncio.sleep(self.window)
+        if self._pending.get(key) is entry:
+            del self._pending[key]
+            await self._edit(entry[0], entry[1])
+
+    async def _edit(self, message: Message, markup: InlineKeyboardMarkup):
+        try:
+            await message.edit_reply_markup(reply_markup=markup)
+            self.edits += 1
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Не удалось обновить клавиатуру сообщения {message.message_id}: {e}")
+
+    async def stop(self):
+        """Отправляет все ожидающие правки при остановке бота"""
+        pending = list(self._pending.values())
+        self._pending.clear()
+        for message, markup, task in pending:
+            task.cancel()
+            await self._edit(message, markup)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'scheduled': self.scheduled,
+            'coalesced': self.coalesced,
+            'skipped': self.skipped,
+            'edits': self.edits,
+            'errors': self.errors,
+        }
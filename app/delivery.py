@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+from aiogram.types import Message
+
+
+@dataclass(frozen=True)
+class ScheduledMessage:
+    """Сообщение последовательности; delay - пауза перед отправкой, в секундах"""
+    text: str
+    delay: float = 0
+    parse_mode: Optional[str] = None
+    reply_markup: Optional[Any] = None
+
+
+class DeliveryScheduler:
+    """Доставляет последовательности сообщений с паузами в фоне.
+
+    Хендлер передает готовую последовательность и сразу завершается (и отвечает на
+    callback), не держа корутину на время пауз. Последовательности одного чата
+    доставляются по очереди; cancel отменяет все недоставленные сообщения чата.
+    """
+
+    def __init__(self):
+        # chat_id -> задача последней принятой последовательности чата
+        self._sequences: Dict[int, asyncio.Task] = {}
+        self.delivered = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def submit(self, message: Message, messages: Iterable[ScheduledMessage]) -> asyncio.Task:
+        """Ставит последовательность в очередь чата сообщения message"""
+        chat_id = message.chat.id
+        previous = self._sequences.get(chat_id)
+        task = asyncio.create_task(self._deliver(message, tuple(messages), previous))
+        self._sequences[chat_id] = task
+        task.add_done_callback(lambda done: self._forget(chat_id, done))
+        return task
+
+    def _forget(self, chat_id: int, task: asyncio.Task):
+        if self._sequences.get(chat_id) is task:
+            del self._sequences[chat_id]
+
+    def cancel(self, chat_id: int) -> bool:
+        """Отменяет недоставленные сообщения чата (например, при повторном /start)"""
+        task = self._sequences.pop(chat_id, None)
+        if task is None or task.done():
+            return False
+        # Отмена последней задачи прерывает и ожидание предыдущих последовательностей чата
+        task.cancel()
+        return True
+
+    async def _deliver(self, message: Message, messages: tuple, previous: Optional[asyncio.Task]):
+        sent = 0
+        try:
+            if previous is not None:
+                await previous
+            for item in messages:
+                if item.delay > 0:
+                    await asyncio.sleep(item.delay)
+                await message.answer(item.text, parse_mode=item.parse_mode, reply_markup=item.reply_markup)
+                sent += 1
+                self.delivered += 1
+        except asyncio.CancelledError:
+            self.cancelled += len(messages) - sent
+            raise
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Не удалось доставить сообщение в чат {message.chat.id}: {e}")
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается доставки начатых последовательностей, оставшиеся отменяет"""
+        tasks = set(self._sequences.values())
+        if not tasks:
+            return
+        logging.info(f"Доставка: ожидаем {len(tasks)} последовательностей")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'active_chats': len(self._sequences),
+            'delivered': self.delivered,
+            'cancelled': self.cancelled,
+            'failed': self.failed,
+        }
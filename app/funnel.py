@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.fsm.context import FSMContext
+from aiogram.types import TelegramObject
+
+from app.content import SUPPORTED_GENDERS
+
+QUESTION_COUNT = 19
+UNKNOWN_GENDER = "unknown"
+
+# Шаги воронки в порядке прохождения; question_N - пользователь ответил на вопрос N
+FUNNEL_STEPS = (
+    "start",
+    "gender",
+    "promo",
+    "instructions",
+    *(f"question_{num}" for num in range(1, QUESTION_COUNT + 1)),
+    "results",
+)
+# Флаг хендлера, по которому шаг вопроса определяется по смене current_question_id
+QUESTION_STEP = "question"
+
+
+class FunnelCounters:
+    """Счетчики шагов воронки по полу.
+
+    Все изменения выполняются в потоке event loop без await между чтением и записью,
+    поэтому блокировки не нужны: инкремент - это одна операция со словарем.
+    """
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.started_at = time.time()
+
+    def increment(self, step: str, gender: Optional[str] = None):
+        self._counts[step][gender if gender in SUPPORTED_GENDERS else UNKNOWN_GENDER] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Копия счетчиков: {шаг: {пол: число}}"""
+        return {step: dict(by_gender) for step, by_gender in self._counts.items()}
+
+    def restore(self, counts: Dict[str, Dict[str, int]]):
+        for step, by_gender in counts.items():
+            for gender, value in by_gender.items():
+                self._counts[step][gender] += value
+
+    def collect(self):
+        """Коллектор метрик: число прохождений каждого шага по полу"""
+        samples = [
+            ({'step': step, 'gender': gender}, value)
+            for step, by_gender in self._counts.items() for gender, value in by_gender.items()
+        ]
+        return [('funnel_step_total', 'counter', 'Прохождения шагов воронки', samples)]
+
+    def total(self, step: str) -> int:
+        return sum(self._counts[step].values()) if step in self._counts else 0
+
+    def format_report(self, note: Optional[str] = None) -> str:
+        """Текстовая воронка с конверсией от предыдущего шага и от /start"""
+        lines = ["📉 <b>Воронка</b> (всего | ж | м | от пред. шага | от /start)"]
+        if note:
+            lines.append(f"<i>{note}</i>")
+        lines[-1] += "\n"
+        steps = list(FUNNEL_STEPS) + sorted(set(self._counts) - set(FUNNEL_STEPS))
+        first = self.total(FUNNEL_STEPS[0])
+        previous = None
+        for step in steps:
+            total = self.total(step)
+            by_gender = self._counts.get(step, {})
+            from_previous = f"{total / previous:.0%}" if previous else "—"
+            from_first = f"{total / first:.0%}" if first else "—"
+            lines.append(
+                f"<code>{step:<12}</code> {total} | {by_gender.get('female', 0)} | {by_gender.get('male', 0)}"
+                f" | {from_previous} | {from_first}"
+            )
+            previous = total
+        return "\n".join(lines)
+
+
+class FunnelMiddleware(BaseMiddleware):
+    """Считает шаги воронки по флагу funnel у хендлера.
+
+    Регистрируется как внутренняя middleware роутера, поэтому срабатывает только для
+    апдейтов, дошедших до хендлера, и только если хендлер завершился без ошибки.
+    Шаг засчитывается, только если хендлер перевел пользователя в следующее состояние:
+    ранние выходы (прогрев, ошибки, повторный /start) и сброс состояния не считаются.
+    """
+
+    def __init__(self, counters: FunnelCounters):
+        self.counters = counters
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        step = get_flag(data, "funnel")
+        state: Optional[FSMContext] = data.get("state")
+        if step is None or state is None:
+            return await handler(event, data)
+
+        question_id = None
+        if step == QUESTION_STEP:
+            question_id = (await state.get_data()).get("current_question_id")
+
+        result = await handler(event, data)
+
+        new_state = await state.get_state()
+        advanced = new_state is not None and new_state != data.get("raw_state")
+        user_data = await state.get_data()
+        gender = user_data.get("selected_gender")
+        if step == QUESTION_STEP:
+            # Вопрос пройден, когда хендлер перешел к следующему вопросу или к результатам
+            if question_id is not None and (advanced or user_data.get("current_question_id") != question_id):
+                self.counters.increment(f"question_{question_id}", gender)
+        elif advanced:
+            self.counters.increment(step, gender)
+        return result
+
+
+def save_counters(path: str, counters: Dict[str, Dict[str, int]]):
+    """Атомарно сохраняет счетчики воронки в JSON-файл"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"saved_at": time.time(), "counts": counters}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_counters(path: str) -> Optional[Dict[str, Dict[str, int]]]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["counts"]
+    except Exception as e:
+        logging.error(f"Не удалось прочитать счетчики воронки {path}: {e}")
+        return None
+
+
+class FunnelSnapshotter:
+    """Периодически сохраняет счетчики на диск и восстанавливает их при старте"""
+
+    def __init__(self, counters: FunnelCounters, path: str, interval: float = 60):
+        self.counters = counters
+        self.path = path
+        self.interval = interval
+        # Режим воркеров: (индекс, число воркеров) и файлы счетчиков остальных воркеров
+        self.worker: Optional[Tuple[int, int]] = None
+        self.peer_paths: List[str] = []
+        self._task = None
+
+    def set_worker(self, index: int, workers: int, paths: List[str]):
+        """Режим воркеров: paths - файлы счетчиков всех воркеров (пустой список - без сохранения)"""
+        self.worker = (index, workers)
+        if paths:
+            self.path = paths[index]
+            self.peer_paths = [path for i, path in enumerate(paths) if i != index]
+
+    def start(self):
+        counts = load_counters(self.path)
+        if counts:
+            self.counters.restore(counts)
+            logging.info(f"Счетчики воронки восстановлены из {self.path}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    async def report(self) -> str:
+        """Воронка для /funnel; в режиме воркеров - сумма по всем воркерам"""
+        if self.worker is None:
+            return self.counters.format_report()
+        index, workers = self.worker
+        if not self.peer_paths:
+            return self.counters.format_report(note=f"Только воркер {index + 1} из {workers}")
+        total = FunnelCounters()
+        total.restore(self.counters.snapshot())
+        for counts in await asyncio.to_thread(lambda: [load_counters(path) for path in self.peer_paths]):
+            if counts:
+                total.restore(counts)
+        return total.format_report(
+            note=f"Сумма по {workers} воркерам; остальные воркеры - на момент их последнего сохранения"
+        )
+
+    async def save(self):
+        try:
+            await asyncio.to_thread(save_counters, self.path, self.counters.snapshot())
+        except Exception as e:
+            logging.error(f"Не удалось сохранить счетчики воронки в {self.path}: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
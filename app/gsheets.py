@@ -1,16 +1,76 @@
 import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
+from gspread.http_client import HTTPClient
 from cachetools import cached, TTLCache
+from functools import partial
 import logging
 import os
 import json
+import threading
+import time
+
+from app.backends import ContentBackend
+from app.content import QuizContent, build_content, content_sheet_names
+from app.quota import SheetsQuota
 
 logging.basicConfig(level=logging.INFO)
 
 scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
 
+# Размер пула HTTP-соединений: не меньше числа потоков AsyncSheetsDB
+HTTP_POOL_SIZE = 8
+# Запросы, повтор которых не меняет результат; остальные повторяются только если точно не выполнились
+IDEMPOTENT_METHODS = frozenset({"get", "head", "options", "put", "delete"})
+
+
+class GovernedHTTPClient(HTTPClient):
+    """HTTP-клиент gspread: каждый запрос проходит через SheetsQuota (лимит и повторы 429/5xx).
+
+    POST (append_rows, batchUpdate) после 5xx или обрыва связи мог уже выполниться, поэтому
+    повторяется только при 429 и при ошибке соединения до отправки запроса.
+    """
+
+    def __init__(self, auth, session=None, quota: SheetsQuota = None):
+        super().__init__(auth, session)
+        self.quota = quota or SheetsQuota()
+
+    def request(self, method: str, endpoint: str, *args, **kwargs):
+        idempotent = method.lower() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.quota.before_request()
+            try:
+                return super().request(method, endpoint, *args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                delay = self.quota.retry_delay(attempt, e.code, retryable=idempotent or e.code == 429)
+                if delay is None:
+                    raise
+            except requests.ConnectTimeout:
+                # Соединение не установлено - запрос точно не отправлен
+                delay = self.quota.retry_delay(attempt, None)
+                if delay is None:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                delay = self.quota.retry_delay(attempt, None, retryable=idempotent)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+
+def authorize(creds, quota: SheetsQuota = None) -> gspread.Client:
+    """Клиент gspread с общим пулом соединений и учетом квоты запросов"""
+    session = AuthorizedSession(creds)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    return gspread.authorize(None, http_client=partial(GovernedHTTPClient, quota=quota), session=session)
+
 class GoogleSheetsDB:
-    def __init__(self, credentials_path=None, credentials_json=None, spreadsheet_key=None):
+    def __init__(self, credentials_path=None, credentials_json=None, spreadsheet_key=None, quota=None):
+        self._worksheets = {}
+        self._worksheets_lock = threading.Lock()
         try:
             if not spreadsheet_key:
                 raise ValueError("SPREADSHEET_KEY не указан в переменных окружения")
@@ -31,14 +91,14 @@ class GoogleSheetsDB:
                 raise ValueError("Either credentials_json or credentials_path must be provided")
 
             logging.info("Авторизация в Google Sheets...")
-            self.client = gspread.authorize(creds)
+            self.client = authorize(creds, quota)
             
             logging.info(f"Открываем таблицу с ключом: {spreadsheet_key}")
             self.spreadsheet = self.client.open_by_key(spreadsheet_key)
             
             # Проверяем доступ к основным листам
             required_sheets = ['Config', 'Questions', 'Answers', 'Archetypes']
-            available_sheets = [ws.title for ws in self.spreadsheet.worksheets()]
+            available_sheets = self._cache_worksheets()
             logging.info(f"Доступные листы: {available_sheets}")
             
             missing_sheets = [sheet for sheet in required_sheets if sheet not in available_sheets]
@@ -60,10 +120,26 @@ class GoogleSheetsDB:
             logging.error(f"Тип ошибки: {type(e).__name__}")
             raise
 
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+    def _cache_worksheets(self) -> list:
+        """Запоминает объекты всех листов одним запросом метаданных и возвращает их названия"""
+        worksheets = self.spreadsheet.worksheets()
+        with self._worksheets_lock:
+            self._worksheets = {worksheet.title: worksheet for worksheet in worksheets}
+        return [worksheet.title for worksheet in worksheets]
+
+    def _worksheet(self, title: str):
+        """Лист по названию без повторного запроса метаданных таблицы"""
+        worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            worksheet = self.spreadsheet.worksheet(title)
+            with self._worksheets_lock:
+                self._worksheets[title] = worksheet
+        return worksheet
+
+    @cached(cache=TTLCache(maxsize=128, ttl=300), lock=threading.Lock())
     def get_config_value(self, key):
         try:
-            sheet = self.spreadsheet.worksheet('Config')
+            sheet = self._worksheet('Config')
             cell = sheet.find(key)
             return sheet.cell(cell.row, cell.col + 1).value
         except gspread.exceptions.WorksheetNotFound:
@@ -73,10 +149,10 @@ class GoogleSheetsDB:
             logging.error(f"Ключ '{key}' не найден на листе 'Config'.")
             return None
 
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+    @cached(cache=TTLCache(maxsize=128, ttl=300), lock=threading.Lock())
     def get_question(self, question_id):
         try:
-            sheet = self.spreadsheet.worksheet('Questions')
+            sheet = self._worksheet('Questions')
             all_rows = sheet.get_all_values()
             for row in all_rows:
                 if row and row[0] == str(question_id):
@@ -86,20 +162,20 @@ class GoogleSheetsDB:
             logging.error("Лист 'Questions' не найден.")
             return None
 
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+    @cached(cache=TTLCache(maxsize=128, ttl=300), lock=threading.Lock())
     def get_answers(self, question_id):
         try:
-            sheet = self.spreadsheet.worksheet('Answers')
+            sheet = self._worksheet('Answers')
             records = sheet.get_all_records()
             return [record for record in records if record.get('question_id') == question_id]
         except gspread.exceptions.WorksheetNotFound:
             logging.error("Лист 'Answers' не найден.")
             return []
 
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+    @cached(cache=TTLCache(maxsize=128, ttl=300), lock=threading.Lock())
     def get_archetype_result(self, archetype_id):
         try:
-            sheet = self.spreadsheet.worksheet('Archetypes')
+            sheet = self._worksheet('Archetypes')
             all_rows = sheet.get_all_values()
             for row in all_rows:
                 if row and row[0] == archetype_id:
@@ -109,10 +185,10 @@ class GoogleSheetsDB:
             logging.error("Лист 'Archetypes' не найден.")
             return None
 
-    @cached(cache=TTLCache(maxsize=10, ttl=3600))
+    @cached(cache=TTLCache(maxsize=10, ttl=3600), lock=threading.Lock())
     def get_all_archetypes(self):
         try:
-            sheet = self.spreadsheet.worksheet('Archetypes')
+            sheet = self._worksheet('Archetypes')
             records = sheet.get_all_records()
             return records
         except gspread.exceptions.WorksheetNotFound:
@@ -195,10 +271,14 @@ class GenderBasedSheetsManager:
         return ["male", "female"]
 
 
-class UnifiedGoogleSheetsDB(GoogleSheetsDB):
+class UnifiedGoogleSheetsDB(GoogleSheetsDB, ContentBackend):
     """Унифицированная база данных с поддержкой выбора листов по полу пользователя"""
     
-    def __init__(self, credentials_path=None, credentials_json=None, spreadsheet_key=None):
+    def __init__(self, credentials_path=None, credentials_json=None, spreadsheet_key=None, quota=None):
+        self._content = None
+        self._content_lock = threading.Lock()
+        self._worksheets = {}
+        self._worksheets_lock = threading.Lock()
         # Сначала инициализируем базовый класс, но без проверки старых листов
         try:
             if not spreadsheet_key:
@@ -219,7 +299,7 @@ class UnifiedGoogleSheetsDB(GoogleSheetsDB):
                 raise ValueError("Either credentials_json or credentials_path must be provided")
             
             logging.info("Авторизация в Google Sheets...")
-            self.client = gspread.authorize(creds)
+            self.client = authorize(creds, quota)
             
             logging.info(f"Открываем объединенную таблицу с ключом: {spreadsheet_key}")
             self.spreadsheet = self.client.open_by_key(spreadsheet_key)
@@ -234,7 +314,7 @@ class UnifiedGoogleSheetsDB(GoogleSheetsDB):
     
     def _validate_unified_structure(self):
         """Проверяет наличие необходимых листов в объединенной таблице"""
-        available_sheets = [ws.title for ws in self.spreadsheet.worksheets()]
+        available_sheets = self._cache_worksheets()
         logging.info(f"Доступные листы в объединенной таблице: {available_sheets}")
         
         # Обязательные листы для новой структуры
@@ -276,79 +356,75 @@ class UnifiedGoogleSheetsDB(GoogleSheetsDB):
             return "female"
         return user_gender
     
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+    def fetch_values(self, sheet_names: list) -> dict:
+        """Загружает значения нескольких листов одним запросом values_batch_get"""
+        ranges = [f"'{name}'" for name in sheet_names]
+        response = self.spreadsheet.values_batch_get(ranges)
+        value_ranges = response.get('valueRanges', [])
+        # Ответ содержит диапазоны в том же порядке, что и запрос
+        return {name: value_range.get('values', []) for name, value_range in zip(sheet_names, value_ranges)}
+
+    def revision(self) -> str:
+        """Время последнего изменения таблицы из Drive API - один легкий запрос без чтения листов.
+
+        Sheets API не сообщает, какой лист изменился, поэтому это признак для всей таблицы.
+        """
+        return self.spreadsheet.get_lastUpdateTime()
+
+    def load_content(self) -> QuizContent:
+        """Загружает Config и все листы контента обоих полов одним запросом и строит индексы"""
+        values = self.fetch_values(content_sheet_names())
+        content = build_content(values)
+        self._content = content
+        return content
+
+    @property
+    def content(self) -> QuizContent:
+        """Последний загруженный снимок контента (загружается при первом обращении)"""
+        if self._content is None:
+            with self._content_lock:
+                if self._content is None:
+                    self.load_content()
+        return self._content
+
+    def get_config_value(self, key):
+        """Получить нормализованное значение из листа Config"""
+        return self.content.config.get(key)
+
     def get_question(self, question_id, user_gender="female"):
-        """Получить вопрос из соответствующего листа в зависимости от пола"""
-        user_gender = self.validate_user_gender(user_gender)
-        sheet_name = self._get_sheet_name("Questions", user_gender)
-        
-        try:
-            sheet = self.spreadsheet.worksheet(sheet_name)
-            all_rows = sheet.get_all_values()
-            for row in all_rows:
-                if row and row[0] == str(question_id):
-                    return {'question_text': row[1], 'prompt_text': row[2]}
-            return None
-        except gspread.exceptions.WorksheetNotFound:
-            logging.error(f"Лист '{sheet_name}' не найден.")
-            return None
-        except Exception as e:
-            logging.error(f"Ошибка получения вопроса {question_id} из листа {sheet_name}: {e}")
-            return None
-    
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+        """Получить вопрос для пола из индекса контента"""
+        return self.content.for_gender(user_gender).questions.get(question_id)
+
     def get_answers(self, question_id, user_gender="female"):
-        """Получить ответы из соответствующего листа в зависимости от пола"""
-        user_gender = self.validate_user_gender(user_gender)
-        sheet_name = self._get_sheet_name("Answers", user_gender)
-        
-        try:
-            sheet = self.spreadsheet.worksheet(sheet_name)
-            records = sheet.get_all_records()
-            return [record for record in records if record.get('question_id') == question_id]
-        except gspread.exceptions.WorksheetNotFound:
-            logging.error(f"Лист '{sheet_name}' не найден.")
-            return []
-        except Exception as e:
-            logging.error(f"Ошибка получения ответов для вопроса {question_id} из листа {sheet_name}: {e}")
-            return []
-    
-    @cached(cache=TTLCache(maxsize=128, ttl=300))
+        """Получить ответы на вопрос для пола из индекса контента"""
+        return self.content.for_gender(user_gender).answers_by_question.get(question_id, ())
+
     def get_archetype_result(self, archetype_id, user_gender="female"):
-        """Получить архетип из соответствующего листа в зависимости от пола"""
-        user_gender = self.validate_user_gender(user_gender)
-        sheet_name = self._get_sheet_name("Archetypes", user_gender)
-        
-        try:
-            sheet = self.spreadsheet.worksheet(sheet_name)
-            all_rows = sheet.get_all_values()
-            for row in all_rows:
-                if row and row[0] == archetype_id:
-                    return {'main_description': row[1], 'secondary_description': row[2]}
-            return None
-        except gspread.exceptions.WorksheetNotFound:
-            logging.error(f"Лист '{sheet_name}' не найден.")
-            return None
-        except Exception as e:
-            logging.error(f"Ошибка получения архетипа {archetype_id} из листа {sheet_name}: {e}")
-            return None
-    
-    @cached(cache=TTLCache(maxsize=10, ttl=3600))
+        """Получить архетип для пола из индекса контента"""
+        return self.content.for_gender(user_gender).archetypes.get(archetype_id)
+
     def get_all_archetypes(self, user_gender="female"):
-        """Получить все архетипы из соответствующего листа в зависимости от пола"""
-        user_gender = self.validate_user_gender(user_gender)
-        sheet_name = self._get_sheet_name("Archetypes", user_gender)
-        
+        """Получить все архетипы для пола в порядке листа"""
+        return self.content.for_gender(user_gender).archetype_list
+
+    def append_rows(self, sheet_name: str, rows: list, header: list = None):
+        """Дописывает строки в конец листа одним запросом; создает лист при первой записи"""
         try:
-            sheet = self.spreadsheet.worksheet(sheet_name)
-            records = sheet.get_all_records()
-            return records
+            sheet = self._worksheet(sheet_name)
         except gspread.exceptions.WorksheetNotFound:
-            logging.error(f"Лист '{sheet_name}' не найден.")
-            return []
-        except Exception as e:
-            logging.error(f"Не удалось получить список архетипов из листа {sheet_name}: {e}")
-            return []
+            logging.info(f"Лист '{sheet_name}' не найден, создаем его")
+            sheet = self.spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=max(len(header or []), 10))
+            with self._worksheets_lock:
+                self._worksheets[sheet_name] = sheet
+            if header:
+                sheet.append_row(header, value_input_option='RAW')
+        try:
+            sheet.append_rows(rows, value_input_option='RAW')
+        except gspread.exceptions.APIError:
+            # Лист могли удалить или переименовать: следующая попытка заново найдет его
+            with self._worksheets_lock:
+                self._worksheets.pop(sheet_name, None)
+            raise
     
     def _handle_sheet_error(self, sheet_name: str, operation: str, error: Exception):
         """Централизованная обработка ошибок доступа к листам"""
@@ -364,7 +440,7 @@ class UnifiedGoogleSheetsDB(GoogleSheetsDB):
         """Проверяет существование листа для указанного пола"""
         sheet_name = self._get_sheet_name(base_name, user_gender)
         try:
-            self.spreadsheet.worksheet(sheet_name)
+            self._worksheet(sheet_name)
             return True
         except gspread.exceptions.WorksheetNotFound:
             logging.warning(f"Лист '{sheet_name}' не найден")
@@ -376,7 +452,7 @@ class UnifiedGoogleSheetsDB(GoogleSheetsDB):
     def get_available_sheets_info(self) -> dict:
         """Возвращает информацию о доступных листах для диагностики"""
         try:
-            available_sheets = [ws.title for ws in self.spreadsheet.worksheets()]
+            available_sheets = self._cache_worksheets()
             
             info = {
                 'all_sheets': available_sheets,
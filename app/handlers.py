@@ -1,30 +1,107 @@
 import asyncio
 import logging
-import random
+from dataclasses import replace
+from functools import partial
+from typing import Optional, Tuple
 from aiogram import F, Router
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, URLInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from app.gsheets import GoogleSheetsDB, UnifiedGoogleSheetsDB
+from app.async_db import AsyncSheetsDB
+from app.backends import content_backend_factory
+from app.content import BASIC_CONFIG_KEYS, FINAL_CONFIG_KEYS
+from app.quota import SheetsQuota
+from app.quiz import add_pick, answer_order, new_shuffle_seed, rank_archetypes
+from app.results import RESULTS_HEADER, ResultsRecorder
+from app.debounce import MarkupDebouncer
+from app.delivery import DeliveryScheduler, ScheduledMessage
+from app.funnel import QUESTION_STEP, FunnelCounters, FunnelMiddleware, FunnelSnapshotter
 from app.keyboards import generate_answers_keyboard, generate_gender_selection_keyboard, generate_final_buttons_keyboard, generate_about_us_keyboard, generate_workbook_keyboard
-from config import GOOGLE_CREDENTIALS_PATH, GOOGLE_CREDENTIALS_JSON, SPREADSHEET_KEY
+from config import (
+    GOOGLE_CREDENTIALS_PATH, GOOGLE_CREDENTIALS_JSON, SPREADSHEET_KEY, SHEETS_MAX_WORKERS,
+    SHEETS_REQUESTS_PER_MINUTE, SHEETS_REQUESTS_BURST,
+    CONTENT_BACKEND, CONTENT_PATH,
+    SHEETS_REFRESH_CONFIG, SHEETS_REFRESH_QUESTIONS, SHEETS_REFRESH_ANSWERS, SHEETS_REFRESH_ARCHETYPES,
+    CONTENT_WATCH_INTERVAL,
+    CONTENT_SNAPSHOT_PATH, RESULTS_ENABLED, RESULTS_SHEET, RESULTS_FLUSH_INTERVAL, RESULTS_BATCH_SIZE,
+    ADMIN_IDS, FUNNEL_SNAPSHOT_PATH, FUNNEL_SNAPSHOT_INTERVAL, ANSWER_EDIT_DEBOUNCE,
+    QUESTION_TRANSITION_MODE,
+)
 
 logging.basicConfig(level=logging.INFO)
 
 router = Router()
 
-# Глобальный экземпляр БД - создается один раз при запуске
-try:
-    global_db = UnifiedGoogleSheetsDB(
+# Глобальный экземпляр БД - создается один раз при запуске.
+# Источник контента выбирается CONTENT_BACKEND: Google Sheets, файлы или SQLite.
+# При импорте ничего не загружается: подключение и загрузка контента выполняются
+# в startup-хуке с повторами; во время недоступности источника контент отдается
+# из локального снимка. Все запросы к Google Sheets API проходят через общий лимит квоты
+sheets_quota = SheetsQuota(SHEETS_REQUESTS_PER_MINUTE, burst=SHEETS_REQUESTS_BURST)
+global_db = AsyncSheetsDB(
+    content_backend_factory(
+        CONTENT_BACKEND,
+        CONTENT_PATH,
         credentials_path=GOOGLE_CREDENTIALS_PATH,
         credentials_json=GOOGLE_CREDENTIALS_JSON,
-        spreadsheet_key=SPREADSHEET_KEY
-    )
-    logging.info("✅ Глобальный экземпляр БД успешно создан")
-except Exception as e:
-    logging.error(f"❌ Ошибка создания глобального экземпляра БД: {e}")
-    global_db = None
+        spreadsheet_key=SPREADSHEET_KEY,
+        quota=sheets_quota,
+    ),
+    max_workers=SHEETS_MAX_WORKERS,
+    refresh_intervals={
+        'Config': SHEETS_REFRESH_CONFIG,
+        'Questions': SHEETS_REFRESH_QUESTIONS,
+        'Answers': SHEETS_REFRESH_ANSWERS,
+        'Archetypes': SHEETS_REFRESH_ARCHETYPES,
+    },
+    snapshot_path=CONTENT_SNAPSHOT_PATH
+)
+
+# Результаты прохождения копятся в памяти и дописываются в лист Results пакетами
+results_recorder = ResultsRecorder(
+    partial(global_db.append_rows, RESULTS_SHEET, header=RESULTS_HEADER),
+    flush_interval=RESULTS_FLUSH_INTERVAL,
+    batch_size=RESULTS_BATCH_SIZE,
+)
+
+# Счетчики воронки: шаг задается флагом funnel у хендлера и считается в middleware
+funnel_counters = FunnelCounters()
+funnel_snapshotter = FunnelSnapshotter(funnel_counters, FUNNEL_SNAPSHOT_PATH, FUNNEL_SNAPSHOT_INTERVAL)
+router.message.middleware(FunnelMiddleware(funnel_counters))
+router.callback_query.middleware(FunnelMiddleware(funnel_counters))
+
+# Отметки выбранных ответов: несколько быстрых нажатий - одна правка клавиатуры
+markup_debouncer = MarkupDebouncer(ANSWER_EDIT_DEBOUNCE)
+
+# Последовательности сообщений с паузами доставляются в фоне, хендлеры не ждут пауз
+delivery = DeliveryScheduler()
+
+
+# Ответ на действия пользователя, пока контент еще не загружен
+WARMING_UP_TEXT = "⏳ Бот запускается и загружает данные. Попробуйте еще раз через несколько секунд."
+
+
+@router.startup()
+async def on_startup():
+    global_db.start_warm_up()
+    if CONTENT_WATCH_INTERVAL > 0:
+        global_db.start_watching(CONTENT_WATCH_INTERVAL)
+    if RESULTS_ENABLED:
+        results_recorder.start()
+    if FUNNEL_SNAPSHOT_PATH:
+        funnel_snapshotter.start()
+
+
+@router.shutdown()
+async def on_shutdown():
+    if RESULTS_ENABLED:
+        await results_recorder.stop()
+    if FUNNEL_SNAPSHOT_PATH:
+        await funnel_snapshotter.stop()
+    await markup_debouncer.stop()
+    await delivery.stop()
+
 
 class Introduction(StatesGroup):
     awaiting_gender_selection = State()
@@ -34,83 +111,92 @@ class Introduction(StatesGroup):
 class Quiz(StatesGroup):
     in_progress = State()
     awaiting_result_confirmation = State()
+    completed = State()
 
 
-async def send_question(message: Message, state: FSMContext):
+async def send_question(message: Message, state: FSMContext, edit: bool = False):
+    """Отправляет текущий вопрос; при edit=True заменяет им сообщение предыдущего вопроса"""
     user_data = await state.get_data()
     
     # Получаем пол пользователя из состояния
     user_gender = user_data.get('selected_gender', 'female')
     
-    if not global_db:
-        await message.answer("Ошибка подключения к базе данных. Попробуйте /start.")
+    if not global_db.ready:
+        await message.answer(WARMING_UP_TEXT)
         return
     question_id = user_data.get('current_question_id', 1)
 
-    question_data = global_db.get_question(question_id, user_gender)
-    answers = global_db.get_answers(question_id, user_gender)
+    template = await global_db.get_question_template(question_id, user_gender)
 
-    if not question_data or not answers:
+    if not template:
         await message.answer("Ошибка при загрузке вопроса. Пожалуйста, /start.")
         logging.error(f"Не удалось загрузить данные для вопроса ID: {question_id}")
         return
 
-    # Перемешиваем ответы для каждого нового вопроса
-    shuffled_answers = answers.copy()
-    random.shuffle(shuffled_answers)
-    
-    # --- ИЗМЕНЕНИЕ: Формируем нумерованный список ответов ---
-    answers_text_list = []
-    for i, answer in enumerate(shuffled_answers):
-        num = i + 1
-        text = answer.get('answer_text', '')
-        answers_text_list.append(f"<b>{num}.</b> {text}")
-    
-    answers_formatted_text = "\n\n".join(answers_text_list)
-
-    full_question_text = (
-        f"<b>{question_data.get('question_text', '')}</b>\n\n"
-        f"{answers_formatted_text}\n\n"
-        f"<i>{question_data.get('prompt_text', '')}</i>"
-    )
-    
-    # Сохраняем текущий перемешанный список ответов
-    await state.update_data(current_answers_order=shuffled_answers)
-
-    await message.answer(
-        full_question_text,
-        reply_markup=generate_answers_keyboard(shuffled_answers, []),
-        parse_mode="HTML"
-    )
+    # Порядок ответов детерминированно выводится из зерна попытки и ID вопроса
+    shuffle_seed = user_data.get('shuffle_seed')
+    if shuffle_seed is None:
+        shuffle_seed = new_shuffle_seed()
+        await state.update_data(shuffle_seed=shuffle_seed)
+
+    # Текст собирается из заранее подготовленных фрагментов шаблона
+    order = answer_order(template.answer_count, shuffle_seed, question_id)
+    full_question_text = template.render(order)
+    keyboard = generate_answers_keyboard(question_id, template.answer_count, [])
+
+    if edit:
+        try:
+            # Один запрос вместо удаления и отправки, без мелькания сообщения
+            await message.edit_text(full_question_text, reply_markup=keyboard, parse_mode="HTML")
+        except Exception as e:
+            logging.warning(f"Не удалось заменить вопрос в сообщении {message.message_id}, отправляем новое: {e}")
+            try:
+                await message.delete()
+            except Exception as delete_error:
+                logging.warning(f"Не удалось удалить сообщение {message.message_id}: {delete_error}")
+            edit = False
+    if not edit:
+        await message.answer(full_question_text, reply_markup=keyboard, parse_mode="HTML")
 
     await state.update_data(
         current_question_id=question_id,
         answered_in_question=[],
-        click_count=0
+        click_count=0,
+        # ID ответов в порядке кнопок: нажатие засчитывается показанному ответу,
+        # даже если лист ответов изменится, пока вопрос на экране
+        question_answers=[template.answer_ids[index] for index in order],
     )
     await state.set_state(Quiz.in_progress)
 
 
-@router.message(CommandStart())
+@router.message(CommandStart(), flags={"funnel": "start"})
 async def start_handler(message: Message, state: FSMContext):
     logging.info(f"User {message.from_user.id} started the conversation.")
+    # Недоставленные сообщения предыдущего прохождения больше не нужны
+    delivery.cancel(message.chat.id)
     await state.clear()
     
     # Показываем приветствие и выбор пола
-    await message.answer("Добро пожаловать в тест архетипов! 🌟")
-    await asyncio.sleep(1)
-    
-    await message.answer(
-        "Для получения наиболее точных результатов, пожалуйста, выберите ваш пол:",
-        reply_markup=generate_gender_selection_keyboard()
-    )
+    delivery.submit(message, [
+        ScheduledMessage("Добро пожаловать в тест архетипов! 🌟"),
+        ScheduledMessage(
+            "Для получения наиболее точных результатов, пожалуйста, выберите ваш пол:",
+            delay=1,
+            reply_markup=generate_gender_selection_keyboard(),
+        ),
+    ])
     
     await state.set_state(Introduction.awaiting_gender_selection)
 
 
-@router.callback_query(Introduction.awaiting_gender_selection, F.data.startswith('gender:'))
+@router.callback_query(Introduction.awaiting_gender_selection, F.data.startswith('gender:'), flags={"funnel": "gender"})
 async def gender_selection_handler(callback_query: CallbackQuery, state: FSMContext):
     """Обработчик выбора пола пользователя"""
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
+        return
+
     # Сразу отвечаем на callback, чтобы избежать timeout
     await callback_query.answer()
     await callback_query.message.edit_reply_markup(reply_markup=None)
@@ -128,12 +214,6 @@ async def gender_selection_handler(callback_query: CallbackQuery, state: FSMCont
     # Проверяем, находимся ли мы в тест-режиме
     user_data = await state.get_data()
     test_mode = user_data.get('test_mode', False)
-    
-    # Проверяем доступность глобальной БД
-    if not global_db:
-        await callback_query.message.answer("Ошибка подключения к базе данных. Попробуйте позже.")
-        await callback_query.answer()
-        return
         
     # Сохраняем только выбранный пол в состоянии
     await state.update_data(selected_gender=gender)
@@ -146,47 +226,52 @@ async def gender_selection_handler(callback_query: CallbackQuery, state: FSMCont
     
     # Показываем подтверждение выбора
     gender_text = "мужчина" if gender == "male" else "женщина"
-    await callback_query.message.answer(f"Отлично! Вы выбрали: {gender_text} 👍")
-    await asyncio.sleep(1)
+    confirmation = ScheduledMessage(f"Отлично! Вы выбрали: {gender_text} 👍")
     
     # Если тест-режим, показываем финальное сообщение и выходим
     if test_mode:
+        await callback_query.message.answer(confirmation.text)
+        await asyncio.sleep(1)
         await handle_test_final_message(callback_query.message, global_db, gender)
         await state.clear()
         return
     
-    # Переходим к промо-сообщению
-    msg1_text = global_db.get_config_value('welcome_sequence_1').replace('\\n', '\n')
-    msg2_text = global_db.get_config_value('welcome_sequence_2').replace('\\n', '\n')
-    promo_text = global_db.get_config_value('promo_sequence').replace('\\n', '\n')
-    
-    await callback_query.message.answer(msg1_text)
-    await asyncio.sleep(1.5)
+    # Переходим к промо-сообщению (все значения Config уже нормализованы при загрузке)
+    config = await global_db.config()
+    msg1_text = config.get('welcome_sequence_1')
+    msg2_text = config.get('welcome_sequence_2')
+    promo_text = config.get('promo_sequence') or "Готовы начать?"
     
-    await callback_query.message.answer(msg2_text)
-    await asyncio.sleep(1.5)
-
-    button_text = global_db.get_config_value('promo_button_text')
+    button_text = config.get('promo_button_text') or "🚀 Начать тест"
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=button_text, callback_data="start_instructions")]
     ])
-    
-    await callback_query.message.answer(promo_text, reply_markup=keyboard)
+
+    # Паузы между сообщениями выдерживает планировщик доставки, хендлер завершается сразу
+    sequence = [confirmation]
+    pause = 1
+    for text in (msg1_text, msg2_text):
+        if text:
+            sequence.append(ScheduledMessage(text, delay=pause))
+            pause = 1.5
+    sequence.append(ScheduledMessage(promo_text, delay=pause, reply_markup=keyboard))
+    delivery.submit(callback_query.message, sequence)
     await state.set_state(Introduction.awaiting_promo_confirmation)
 
 
-@router.callback_query(Introduction.awaiting_promo_confirmation, F.data == "start_instructions")
+@router.callback_query(Introduction.awaiting_promo_confirmation, F.data == "start_instructions", flags={"funnel": "promo"})
 async def instructions_handler(callback_query: CallbackQuery, state: FSMContext):
-    await callback_query.message.edit_reply_markup(reply_markup=None) 
-    
-    if not global_db:
-        await callback_query.message.answer("Ошибка подключения к базе данных. Попробуйте /start.")
-        await callback_query.answer()
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
         return
+
+    await callback_query.message.edit_reply_markup(reply_markup=None) 
     
     # Config лист общий для всех, поэтому не передаем пол
-    instruction_text = global_db.get_config_value('instruction_sequence').replace('\\n', '\n')
-    button_text = global_db.get_config_value('start_button_text')
+    config = await global_db.config()
+    instruction_text = config.get('instruction_sequence') or "<b>Инструкция:</b>\n\nДля каждого вопроса выберите <b>3 варианта</b>."
+    button_text = config.get('start_button_text') or "✨ Начать викторину"
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=button_text, callback_data="start_quiz_now")]
     ])
@@ -201,64 +286,90 @@ async def instructions_handler(callback_query: CallbackQuery, state: FSMContext)
     await callback_query.answer()
 
 
-@router.callback_query(Introduction.awaiting_quiz_start, F.data == "start_quiz_now")
+@router.callback_query(Introduction.awaiting_quiz_start, F.data == "start_quiz_now", flags={"funnel": "instructions"})
 async def quiz_start_handler(callback_query: CallbackQuery, state: FSMContext):
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
+        return
+
     await callback_query.message.edit_reply_markup(reply_markup=None)
     
     user_data = await state.get_data()
     user_gender = user_data.get('selected_gender', 'female')
     
-    if not global_db:
-        await callback_query.message.answer("Ошибка подключения к базе данных. Попробуйте /start.")
-        await callback_query.answer()
-        return
-    all_archetypes = global_db.get_all_archetypes(user_gender)
+    all_archetypes = await global_db.get_all_archetypes(user_gender)
     if not all_archetypes:
         await callback_query.message.answer("Ошибка: не удалось загрузить данные. /start.")
         logging.error("Список архетипов пуст.")
         return
         
-    initial_scores = {archetype['archetype_id']: 0 for archetype in all_archetypes if 'archetype_id' in archetype}
-    await state.update_data(scores=initial_scores, current_question_id=1)
+    initial_scores = {archetype.archetype_id: 0 for archetype in all_archetypes}
+    await state.update_data(scores=initial_scores, current_question_id=1, shuffle_seed=new_shuffle_seed())
     
     await send_question(callback_query.message, state)
     await callback_query.answer()
 
 
-@router.callback_query(Quiz.in_progress, F.data.startswith('ans_num:'))
+def parse_answer_callback(data: str) -> Tuple[Optional[int], int]:
+    """ID вопроса и номер кнопки из ans_num:<вопрос>:<номер> (None для старых клавиатур ans_num:<номер>)"""
+    parts = data.split(':')
+    if len(parts) == 3:
+        return int(parts[1]), int(parts[2])
+    return None, int(parts[1])
+
+
+@router.callback_query(Quiz.in_progress, F.data.startswith('ans_num:'), flags={"funnel": QUESTION_STEP})
 async def callback_answer_handler(callback_query: CallbackQuery, state: FSMContext):
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
+        return
+
     user_data = await state.get_data()
-    click_count = user_data.get('click_count', 0)
+    question_id = user_data.get('current_question_id', 1)
+    button_question_id, answer_num = parse_answer_callback(callback_query.data)
+    if button_question_id is not None and button_question_id != question_id:
+        # Нажатие на клавиатуру уже пройденного вопроса (например, повторное, пока
+        # обрабатывался третий выбор) не должно засчитываться следующему вопросу
+        await callback_query.answer()
+        return
 
+    click_count = user_data.get('click_count', 0)
     if click_count >= 3:
         await callback_query.answer("Вы уже выбрали 3 варианта.", show_alert=True)
         return
 
-    # --- ИЗМЕНЕНИЕ: Получаем номер ответа и находим его ID ---
-    answer_num = int(callback_query.data.split(':')[1])
-    answers = user_data.get('current_answers_order', [])
+    # Номер кнопки сопоставляется с ID ответа, показанного на этой позиции
+    user_gender = user_data.get('selected_gender', 'female')
+    shown_ids = user_data.get('question_answers')
+    if shown_ids is None:
+        # Вопрос отправлен до появления question_answers: порядок по текущему контенту
+        answers = await global_db.get_answers(question_id, user_gender)
+        order = answer_order(len(answers), user_data.get('shuffle_seed', 0), question_id)
+        shown_ids = [answers[index].answer_id for index in order]
     
     # Номер - это индекс + 1
-    if not (0 < answer_num <= len(answers)):
+    if not (0 < answer_num <= len(shown_ids)):
         await callback_query.answer("Ошибка! Неверный номер ответа.", show_alert=True)
         return
 
-    selected_answer = answers[answer_num - 1]
-    answer_id = selected_answer.get('answer_id')
-    
+    # В состоянии хранятся номера выбранных кнопок в порядке выбора
     answered_in_question = user_data.get('answered_in_question', [])
-    if answer_id in answered_in_question:
+    if answer_num in answered_in_question:
         await callback_query.answer("Этот вариант уже выбран.", show_alert=False)
         return
 
+    selected_id = shown_ids[answer_num - 1]
+    selected_answer = await global_db.get_answer(selected_id, user_gender)
+    if selected_answer is None or selected_answer.question_id != question_id:
+        await callback_query.answer("Этот вариант ответа был изменен. Выберите другой.", show_alert=True)
+        return
+
     click_count += 1
-    answered_in_question.append(answer_id)
+    answered_in_question.append(answer_num)
     
-    archetype_id = selected_answer.get('archetype_id')
-    points = 3 - (click_count - 1)
-    
-    scores = user_data.get('scores', {})
-    scores[archetype_id] = scores.get(archetype_id, 0) + points
+    scores = add_pick(user_data.get('scores', {}), selected_answer.archetype_id, click_count)
     
     await state.update_data(
         click_count=click_count, 
@@ -266,34 +377,51 @@ async def callback_answer_handler(callback_query: CallbackQuery, state: FSMConte
         scores=scores
     )
 
-    await callback_query.message.edit_reply_markup(
-        reply_markup=generate_answers_keyboard(answers, answered_in_question)
-    )
+    keyboard = generate_answers_keyboard(question_id, len(shown_ids), answered_in_question)
+    current_question_id = user_data.get('current_question_id')
 
     if click_count == 3:
+        if current_question_id == 19:
+            # Сообщение последнего вопроса остается в чате - показываем все три выбора
+            await markup_debouncer.flush(callback_query.message, keyboard)
+        else:
+            # Сообщение сейчас будет заменено следующим вопросом, правка клавиатуры не нужна
+            markup_debouncer.cancel(callback_query.message)
         await callback_query.answer("Принято! Все 3 варианта выбраны.", show_alert=False)
         await asyncio.sleep(1.5)
 
-        current_question_id = user_data.get('current_question_id')
         if current_question_id == 19:
             await ask_to_show_results(callback_query.message, state)
+        elif QUESTION_TRANSITION_MODE == "edit":
+            # Следующий вопрос заменяет текущий в том же сообщении
+            await state.update_data(current_question_id=current_question_id + 1)
+            await send_question(callback_query.message, state, edit=True)
         else:
             # Удаляем старое сообщение с вопросом перед отправкой нового
             await callback_query.message.delete()
             await state.update_data(current_question_id=current_question_id + 1)
             await send_question(callback_query.message, state)
     else:
+        # Выборы, сделанные подряд, попадают в одну правку клавиатуры
+        await markup_debouncer.schedule(callback_query.message, keyboard)
         await callback_query.answer()
 
 
+@router.callback_query(F.data.startswith('ans_num:'))
+async def stale_answer_handler(callback_query: CallbackQuery):
+    """Нажатие на клавиатуру вопроса после завершения викторины: просто закрываем callback"""
+    await callback_query.answer()
+
+
 async def ask_to_show_results(message: Message, state: FSMContext):
-    if not global_db:
-        await message.answer("Ошибка подключения к базе данных. Попробуйте /start.")
+    if not global_db.ready:
+        await message.answer(WARMING_UP_TEXT)
         return
     
     # Config лист общий для всех, поэтому не передаем пол
-    final_text = global_db.get_config_value('final_cta_text').replace('\\n', '\n')
-    button_text = global_db.get_config_value('final_cta_button')
+    config = await global_db.config()
+    final_text = config.get('final_cta_text') or "🎉 Тест завершен!"
+    button_text = config.get('final_cta_button') or "📊 Показать результаты"
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=button_text, callback_data="show_final_result")]
@@ -303,8 +431,13 @@ async def ask_to_show_results(message: Message, state: FSMContext):
     await state.set_state(Quiz.awaiting_result_confirmation)
 
 
-@router.callback_query(Quiz.awaiting_result_confirmation, F.data == "show_final_result")
+@router.callback_query(Quiz.awaiting_result_confirmation, F.data == "show_final_result", flags={"funnel": "results"})
 async def show_results_handler(callback_query: CallbackQuery, state: FSMContext):
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
+        return
+
     await callback_query.message.edit_reply_markup(reply_markup=None)
 
     user_data = await state.get_data()
@@ -314,70 +447,51 @@ async def show_results_handler(callback_query: CallbackQuery, state: FSMContext)
         await callback_query.message.answer("Не удалось рассчитать результаты. /start.")
         return
         
-    sorted_archetypes = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    sorted_archetypes = rank_archetypes(scores)
     
     # Получаем пол пользователя из состояния
     user_gender = user_data.get('selected_gender', 'female')
-    
-    if not global_db:
-        await callback_query.message.answer("Ошибка подключения к базе данных. Попробуйте /start.")
-        await callback_query.answer()
-        return
-    
-    # Отправляем основной архетип
-    if len(sorted_archetypes) > 0:
-        primary_archetype_id = sorted_archetypes[0][0]
-        primary_result = global_db.get_archetype_result(primary_archetype_id, user_gender)
-        if primary_result:
-            text = primary_result.get('main_description', '').replace('\\n', '\n')
-            if text:
-                await callback_query.message.answer(text, parse_mode="HTML")
-                await asyncio.sleep(2)  # Пауза между сообщениями
-    
-    # Отправляем второй архетип
-    if len(sorted_archetypes) > 1:
-        secondary_1_id = sorted_archetypes[1][0]
-        secondary_1_result = global_db.get_archetype_result(secondary_1_id, user_gender)
-        if secondary_1_result:
-            text = secondary_1_result.get('secondary_description', '').replace('\\n', '\n')
-            if text:
-                await callback_query.message.answer(text, parse_mode="HTML")
-                await asyncio.sleep(2)  # Пауза между сообщениями
 
-    # Отправляем третий архетип
-    if len(sorted_archetypes) > 2:
-        secondary_2_id = sorted_archetypes[2][0]
-        secondary_2_result = global_db.get_archetype_result(secondary_2_id, user_gender)
-        if secondary_2_result:
-            text = secondary_2_result.get('secondary_description', '').replace('\\n', '\n')
-            if text:
-                await callback_query.message.answer(text, parse_mode="HTML")
-                await asyncio.sleep(2)  # Пауза между сообщениями
-
-    # Отправляем финальное сообщение с PDF, видео и ссылкой на оплату
-    await send_final_media_and_payment(callback_query.message, global_db)
-    
-    # Состояние будет очищено после нажатия на финальные кнопки
+    if RESULTS_ENABLED:
+        results_recorder.record(callback_query.from_user.id, user_gender, sorted_archetypes)
+    
+    # Описания трех ведущих архетипов (основной и два дополнительных) с паузами по 2 секунды
+    sequence = []
+    pause = 0
+    for position, (archetype_id, _) in enumerate(sorted_archetypes[:3]):
+        result = await global_db.get_archetype_result(archetype_id, user_gender)
+        if not result:
+            continue
+        text = result.main_description if position == 0 else result.secondary_description
+        if text:
+            sequence.append(ScheduledMessage(text, delay=pause, parse_mode="HTML"))
+            pause = 2
+
+    # Финальное сообщение с PDF, видео и ссылкой на оплату
+    sequence.append(replace(await build_final_message(global_db), delay=pause))
+    delivery.submit(callback_query.message, sequence)
+    
+    # Результаты показаны; состояние будет очищено после нажатия на финальные кнопки
+    await state.set_state(Quiz.completed)
     await callback_query.answer()
 
 
 @router.callback_query(F.data == "about_us")
 async def about_us_handler(callback_query: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Узнать больше про нас'"""
-    await callback_query.answer()
-    
-    if not global_db:
-        await callback_query.message.answer("Ошибка подключения к базе данных. Попробуйте позже.")
-        await state.clear()
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
         return
+
+    await callback_query.answer()
     
     # Получаем текст about_us из конфигурации
-    about_us_text = global_db.get_config_value('about_us')
+    about_us_text = (await global_db.config()).get('about_us')
     
     if about_us_text:
-        formatted_text = about_us_text.replace('\\n', '\n')
         keyboard = generate_about_us_keyboard()
-        await callback_query.message.answer(formatted_text, parse_mode="HTML", reply_markup=keyboard)
+        await callback_query.message.answer(about_us_text, parse_mode="HTML", reply_markup=keyboard)
     else:
         await callback_query.message.answer("Информация временно недоступна.")
     
@@ -388,34 +502,42 @@ async def about_us_handler(callback_query: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "workbook")
 async def workbook_handler(callback_query: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Скачать рабочую тетрадь magic book'"""
-    await callback_query.answer()
-    
-    if not global_db:
-        await callback_query.message.answer("Ошибка подключения к базе данных. Попробуйте позже.")
+    if not global_db.ready:
+        # Клавиатура остается на месте, пользователь может нажать кнопку еще раз
+        await callback_query.answer(WARMING_UP_TEXT, show_alert=True)
         return
+
+    await callback_query.answer()
     
     # Получаем текст workbook из конфигурации
-    workbook_text = global_db.get_config_value('workbook')
+    workbook_text = (await global_db.config()).get('workbook')
     
     if workbook_text:
-        formatted_text = workbook_text.replace('\\n', '\n')
         keyboard = generate_workbook_keyboard()
-        await callback_query.message.answer(formatted_text, parse_mode="HTML", reply_markup=keyboard)
+        await callback_query.message.answer(workbook_text, parse_mode="HTML", reply_markup=keyboard)
     else:
         await callback_query.message.answer("Информация о рабочей тетради временно недоступна.")
 
 
-async def send_final_media_and_payment(message: Message, db: GoogleSheetsDB):
+async def send_final_media_and_payment(message: Message, db: AsyncSheetsDB):
     """Отправляет PDF ссылку, видео и ссылку на оплату в конце теста"""
+    final_message = await build_final_message(db)
+    await message.answer(final_message.text, parse_mode=final_message.parse_mode,
+                         reply_markup=final_message.reply_markup)
+
+
+async def build_final_message(db: AsyncSheetsDB) -> ScheduledMessage:
+    """Собирает финальное сообщение с кнопками (PDF, видео, оплата)"""
     try:
         # Получаем данные из Google Sheets (используем существующие ключи)
-        pdf_url = db.get_config_value('final_pdf_url')
-        video_url = db.get_config_value('final_video_url')
-        payment_url = db.get_config_value('payment_url')
+        config = await db.config()
+        pdf_url = config.get('final_pdf_url')
+        video_url = config.get('final_video_url')
+        payment_url = config.get('payment_url')
         
         # Используем существующие ключи из Config
-        final_message_text = db.get_config_value('final_message_text')
-        payment_button_text = db.get_config_value('final_cta_button')
+        final_message_text = config.get('final_message_text')
+        payment_button_text = config.get('final_cta_button')
         
         # Подробное логирование для отладки
         logging.info(f"📊 Финальные настройки:")
@@ -426,19 +548,17 @@ async def send_final_media_and_payment(message: Message, db: GoogleSheetsDB):
         logging.info(f"   Button text: '{payment_button_text}'")
 
         # Отправляем финальное сообщение с кнопками
-        message_text = final_message_text or "🎉 <b>Поздравляем!</b>\n\nВы успешно прошли тест архетипов!\n\nСпасибо за участие!"
-        formatted_text = message_text.replace('\\n', '\n')
+        formatted_text = final_message_text or "🎉 <b>Поздравляем!</b>\n\nВы успешно прошли тест архетипов!\n\nСпасибо за участие!"
         
         logging.info("📨 Отправляем финальное сообщение с кнопками")
         keyboard = generate_final_buttons_keyboard()
-        await message.answer(formatted_text, parse_mode="HTML", reply_markup=keyboard)
-        
         # Больше ничего не отправляем автоматически - только кнопки для взаимодействия
+        return ScheduledMessage(formatted_text, parse_mode="HTML", reply_markup=keyboard)
 
     except Exception as e:
-        logging.error(f"Ошибка при отправке финальных материалов: {e}")
+        logging.error(f"Ошибка при подготовке финальных материалов: {e}")
         # Отправляем базовое сообщение в случае ошибки
-        await message.answer("Спасибо за прохождение теста! 🎉")
+        return ScheduledMessage("Спасибо за прохождение теста! 🎉")
 
 
 @router.message(Command("help"))
@@ -472,27 +592,24 @@ async def test_handler(message: Message, state: FSMContext):
 @router.message(Command("debug"))
 async def debug_handler(message: Message):
     """Отладочная команда для проверки Config листа"""
-    if not global_db:
-        await message.answer("❌ Глобальная БД недоступна")
+    if not global_db.ready:
+        await message.answer("⏳ Контент еще загружается")
         return
     
     try:
-        
-        # Проверяем основные ключи
-        basic_keys = ['welcome_sequence_1', 'welcome_sequence_2', 'promo_sequence', 'promo_button_text', 'start_button_text']
-        final_keys = ['final_cta_text', 'final_cta_button', 'final_proposition', 'final_pdf_url', 'final_video_url', 'payment_url']
+        config = await global_db.config()
         
         debug_info = "🔍 <b>Отладочная информация:</b>\n\n"
         
         debug_info += "<b>Основные ключи:</b>\n"
-        for key in basic_keys:
-            value = global_db.get_config_value(key)
+        for key in BASIC_CONFIG_KEYS:
+            value = config.get(key)
             status = "✅" if value else "❌"
             debug_info += f"{status} {key}: {bool(value)}\n"
         
         debug_info += "\n<b>Финальные ключи:</b>\n"
-        for key in final_keys:
-            value = global_db.get_config_value(key)
+        for key in FINAL_CONFIG_KEYS:
+            value = config.get(key)
             status = "✅" if value else "❌"
             debug_info += f"{status} {key}: {bool(value)}\n"
             
@@ -500,11 +617,25 @@ async def debug_handler(message: Message):
             if key in ['final_pdf_url', 'final_video_url'] and value:
                 debug_info += f"   📎 {key}: {value[:50]}{'...' if len(value) > 50 else ''}\n"
         
+        if config.missing:
+            debug_info += f"\n⚠️ <b>Отсутствуют обязательные ключи:</b> {', '.join(config.missing)}\n"
+        
+        stats = global_db.cache.stats()
+        debug_info += (
+            f"\n<b>Кэш листов:</b> попаданий {stats['hits']}, промахов {stats['misses']}, "
+            f"обновлений {stats['refreshes']}, ошибок {stats['refresh_errors']}\n"
+        )
+        quota = sheets_quota.stats()
+        debug_info += (
+            f"<b>Google Sheets API:</b> {quota['requests_last_minute']} из {quota['limit_per_minute']:g} "
+            f"запросов за минуту, повторов {quota['retries']}, ошибок {quota['errors']}\n"
+        )
+        
         await message.answer(debug_info, parse_mode="HTML")
         
         # Дополнительная информация о медиа-файлах
-        pdf_url = db.get_config_value('final_pdf_url')
-        video_url = db.get_config_value('final_video_url')
+        pdf_url = config.get('final_pdf_url')
+        video_url = config.get('final_video_url')
         
         if pdf_url or video_url:
             media_info = "\n🔗 <b>Медиа-ссылки (полные):</b>\n\n"
@@ -525,14 +656,22 @@ async def debug_handler(message: Message):
         await message.answer(f"❌ Ошибка отладки: {e}")
 
 
+@router.message(Command("funnel"))
+async def funnel_handler(message: Message):
+    """Воронка прохождения теста (только для администраторов)"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(await funnel_snapshotter.report(), parse_mode="HTML")
+
+
 # Модифицируем обработчик выбора пола для поддержки тест-режима
-async def handle_test_final_message(message: Message, db: UnifiedGoogleSheetsDB, user_gender: str = "female"):
+async def handle_test_final_message(message: Message, db: AsyncSheetsDB, user_gender: str = "female"):
     """Отправляет тестовое финальное сообщение с примерными результатами"""
     await message.answer("🎯 <b>Результаты теста (ТЕСТОВЫЙ РЕЖИМ)</b>", parse_mode="HTML")
     await asyncio.sleep(1)
     
     # Получаем все архетипы для демонстрации
-    all_archetypes = db.get_all_archetypes(user_gender)
+    all_archetypes = await db.get_all_archetypes(user_gender)
     if not all_archetypes:
         await message.answer("❌ Ошибка: не удалось загрузить архетипы из таблицы")
         return
@@ -542,33 +681,33 @@ async def handle_test_final_message(message: Message, db: UnifiedGoogleSheetsDB,
     
     # Отправляем основной архетип
     if len(demo_archetypes) > 0:
-        primary_archetype_id = demo_archetypes[0].get('archetype_id')
+        primary_archetype_id = demo_archetypes[0].archetype_id
         if primary_archetype_id:
-            primary_result = global_db.get_archetype_result(primary_archetype_id, user_gender)
+            primary_result = await global_db.get_archetype_result(primary_archetype_id, user_gender)
             if primary_result:
-                text = primary_result.get('main_description', '').replace('\\n', '\n')
+                text = primary_result.main_description
                 if text:
                     await message.answer(f"🥇 <b>Основной архетип:</b>\n\n{text}", parse_mode="HTML")
                     await asyncio.sleep(0.5)
     
     # Отправляем второй архетип
     if len(demo_archetypes) > 1:
-        secondary_1_id = demo_archetypes[1].get('archetype_id')
+        secondary_1_id = demo_archetypes[1].archetype_id
         if secondary_1_id:
-            secondary_1_result = global_db.get_archetype_result(secondary_1_id, user_gender)
+            secondary_1_result = await global_db.get_archetype_result(secondary_1_id, user_gender)
             if secondary_1_result:
-                text = secondary_1_result.get('secondary_description', '').replace('\\n', '\n')
+                text = secondary_1_result.secondary_description
                 if text:
                     await message.answer(f"🥈 <b>Вторичный архетип:</b>\n\n{text}", parse_mode="HTML")
                     await asyncio.sleep(0.5)
 
     # Отправляем третий архетип
     if len(demo_archetypes) > 2:
-        secondary_2_id = demo_archetypes[2].get('archetype_id')
+        secondary_2_id = demo_archetypes[2].archetype_id
         if secondary_2_id:
-            secondary_2_result = global_db.get_archetype_result(secondary_2_id, user_gender)
+            secondary_2_result = await global_db.get_archetype_result(secondary_2_id, user_gender)
             if secondary_2_result:
-                text = secondary_2_result.get('secondary_description', '').replace('\\n', '\n')
+                text = secondary_2_result.secondary_description
                 if text:
                     await message.answer(f"🥉 <b>Третий архетип:</b>\n\n{text}", parse_mode="HTML")
                     await asyncio.sleep(0.5)
@@ -1,71 +1,110 @@
+from functools import lru_cache
+from itertools import permutations
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-def generate_answers_keyboard(answers: list, answered_ids: list) -> InlineKeyboardMarkup:
+# Пользователь выбирает до трех ответов; эмодзи показывают порядок выбора
+MAX_PICKS = 3
+CHOICE_EMOJIS = ("1️⃣", "2️⃣", "3️⃣")
+# По схеме 19 вопросов по 6 ответов: их клавиатуры до третьего выбора строятся заранее.
+# Клавиатура с тремя выборами нужна только последнему вопросу и берется из LRU-кэша
+PRECOMPUTED_QUESTION_IDS = range(1, 20)
+PRECOMPUTED_ANSWER_COUNT = 6
+ANSWERS_KEYBOARD_CACHE_SIZE = 1024
+
+
+def _build_answers_keyboard(question_id: int, answer_count: int, answered_nums: tuple) -> InlineKeyboardMarkup:
+    """Строит клавиатуру ответов: номера кнопок, выбранные заменены эмодзи порядка выбора.
+
+    В callback_data есть ID вопроса: нажатие на клавиатуру уже пройденного вопроса
+    можно отличить от нажатия на текущую, даже если сообщение то же (режим edit).
     """
-    Генерирует клавиатуру с кнопками-цифрами.
-    :param answers: Полный список ответов для вопроса (для получения ID).
-    :param answered_ids: Список ID ответов, которые уже выбраны.
+    answered_order = {answer_num: index for index, answer_num in enumerate(answered_nums)}
+    buttons = [
+        InlineKeyboardButton(
+            text=CHOICE_EMOJIS[answered_order[num]] if num in answered_order else f"{num}",
+            callback_data=f"ans_num:{question_id}:{num}"
+        )
+        for num in range(1, answer_count + 1)
+    ]
+    # Размещаем по 3 кнопки в ряд
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 3] for i in range(0, len(buttons), 3)])
+
+
+def _precompute_answers_keyboards(question_id: int, answer_count: int) -> dict:
+    """Состояния клавиатуры вопроса до третьего выбора: ключ - кортеж номеров в порядке выбора"""
+    keyboards = {}
+    for picks_count in range(MAX_PICKS):
+        for picks in permutations(range(1, answer_count + 1), picks_count):
+            keyboards[picks] = _build_answers_keyboard(question_id, answer_count, picks)
+    return keyboards
+
+
+_ANSWERS_KEYBOARDS = {
+    question_id: _precompute_answers_keyboards(question_id, PRECOMPUTED_ANSWER_COUNT)
+    for question_id in PRECOMPUTED_QUESTION_IDS
+}
+
+
+@lru_cache(maxsize=ANSWERS_KEYBOARD_CACHE_SIZE)
+def _answers_keyboard_fallback(question_id: int, answer_count: int, answered_nums: tuple) -> InlineKeyboardMarkup:
+    return _build_answers_keyboard(question_id, answer_count, answered_nums)
+
+
+def generate_answers_keyboard(question_id: int, answer_count: int, answered_nums) -> InlineKeyboardMarkup:
     """
-    builder = InlineKeyboardBuilder()
-    
-    # Создаем словарь для быстрого поиска ID по номеру и наоборот
-    id_to_num_map = {answer.get('answer_id'): i + 1 for i, answer in enumerate(answers)}
-    
-    choice_emojis = ["1️⃣", "2️⃣", "3️⃣"]
-    
-    # Создаем словарь для быстрого поиска порядка ответа
-    answered_order = {answer_id: index + 1 for index, answer_id in enumerate(answered_ids)}
-
-    for i, answer in enumerate(answers):
-        answer_id = answer.get('answer_id')
-        num = i + 1
-        text = f"{num}"
-
-        # Проверяем, был ли этот ответ выбран
-        if answer_id in answered_order:
-            choice_number = answered_order[answer_id]
-            # Добавляем соответствующий эмодзи
-            emoji = choice_emojis[choice_number - 1]
-            text = f"{emoji}"
-        
-        # В callback_data теперь передаем номер, а не ID
-        builder.add(InlineKeyboardButton(text=text, callback_data=f"ans_num:{num}"))
+    Возвращает заранее построенную клавиатуру с кнопками-цифрами.
+    :param question_id: ID вопроса, к которому привязаны кнопки.
+    :param answer_count: Количество ответов у вопроса.
+    :param answered_nums: Номера уже выбранных ответов в порядке выбора.
+    """
+    key = tuple(answered_nums)
+    if answer_count == PRECOMPUTED_ANSWER_COUNT:
+        keyboards = _ANSWERS_KEYBOARDS.get(question_id)
+        if keyboards is not None and key in keyboards:
+            return keyboards[key]
+    return _answers_keyboard_fallback(question_id, answer_count, key)
 
-    # Размещаем по 3 кнопки в ряд
-    builder.adjust(3)
-    return builder.as_markup()
+
+# Статические клавиатуры строятся один раз при импорте
+GENDER_SELECTION_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="👨 Мужчина", callback_data="gender:male")],
+    [InlineKeyboardButton(text="👩 Женщина", callback_data="gender:female")]
+])
+
+FINAL_BUTTONS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Присоединиться к закрытому каналу", url="https://t.me/tribute/app?startapp=sycj")],
+    [InlineKeyboardButton(text="Узнать больше про нас", callback_data="about_us")]
+])
+
+ABOUT_US_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✨ 🧚🏻 Присоединиться к закрытому каналу по ранней цене  — стать частью волшебного сообщества", url="https://t.me/tribute/app?startapp=sycj")],
+    [InlineKeyboardButton(text="📖Скачать рабочую тетрадь magic book — твой персональный навигатор по созданию бренда", callback_data="workbook")],
+    [InlineKeyboardButton(text="💬 Задать вопрос службе заботы", url="https://t.me/cooperative_skazka")]
+])
+
+WORKBOOK_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Скачать", url="https://drive.google.com/file/d/1Kemc-bGezHYzXMwzv342zr3cIR_YJfT4/view?usp=drivesdk")],
+    [InlineKeyboardButton(text="✨ 🧚🏻 Присоединиться к закрытому каналу по ранней цене  — стать частью волшебного сообщества", url="https://t.me/tribute/app?startapp=sycj")],
+    [InlineKeyboardButton(text="💬 Задать вопрос службе заботы", url="https://t.me/cooperative_skazka")]
+])
 
 
 def generate_gender_selection_keyboard() -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру для выбора пола"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👨 Мужчина", callback_data="gender:male")],
-        [InlineKeyboardButton(text="👩 Женщина", callback_data="gender:female")]
-    ])
+    """Возвращает клавиатуру для выбора пола"""
+    return GENDER_SELECTION_KEYBOARD
 
 
 def generate_final_buttons_keyboard() -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру с финальными кнопками"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Присоединиться к закрытому каналу", url="https://t.me/tribute/app?startapp=sycj")],
-        [InlineKeyboardButton(text="Узнать больше про нас", callback_data="about_us")]
-    ])
+    """Возвращает клавиатуру с финальными кнопками"""
+    return FINAL_BUTTONS_KEYBOARD
 
 
 def generate_about_us_keyboard() -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру для сообщения about_us"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✨ 🧚🏻 Присоединиться к закрытому каналу по ранней цене  — стать частью волшебного сообщества", url="https://t.me/tribute/app?startapp=sycj")],
-        [InlineKeyboardButton(text="📖Скачать рабочую тетрадь magic book — твой персональный навигатор по созданию бренда", callback_data="workbook")],
-        [InlineKeyboardButton(text="💬 Задать вопрос службе заботы", url="https://t.me/cooperative_skazka")]
-    ])
+    """Возвращает клавиатуру для сообщения about_us"""
+    return ABOUT_US_KEYBOARD
 
 
 def generate_workbook_keyboard() -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру для сообщения workbook с кнопкой скачивания и дополнительными действиями"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Скачать", url="https://drive.google.com/file/d/1Kemc-bGezHYzXMwzv342zr3cIR_YJfT4/view?usp=drivesdk")],
-        [InlineKeyboardButton(text="✨ 🧚🏻 Присоединиться к закрытому каналу по ранней цене  — стать частью волшебного сообщества", url="https://t.me/tribute/app?startapp=sycj")],
-        [InlineKeyboardButton(text="💬 Задать вопрос службе заботы", url="https://t.me/cooperative_skazka")]
-    ])
\ No newline at end of file
+    """Возвращает клавиатуру для сообщения workbook с кнопкой скачивания и дополнительными действиями"""
+    return WORKBOOK_KEYBOARD
@@ -0,0 +1,253 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Монотонный счетчик с метками (потокобезопасный: используется и из пула gspread)"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items]
+
+
+class Histogram:
+    """Гистограмма длительностей с кумулятивными корзинами в формате Prometheus"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счетчики по корзинам (+Inf последней), сумма]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket_labels = _labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# Коллектор возвращает значения, которые уже считаются в других компонентах:
+# [(имя, тип, описание, [(метки {имя: значение}, значение), ...]), ...]
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logging.error(f"Ошибка сбора метрик: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    label_text = _labels(tuple(labels), tuple(labels.values()))
+                    lines.append(f"{name}{label_text} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def stats_collector(prefix: str, stats: Callable[[], Dict[str, float]], documentation: str,
+                    counters: Iterable[str] = ()) -> Collector:
+    """Коллектор для словаря stats() компонента: ключи из counters - счетчики, остальные - gauge"""
+    counters = frozenset(counters)
+
+    def collect():
+        families = []
+        for key, value in stats().items():
+            if key in counters:
+                families.append((f"{prefix}_{key}_total", 'counter', documentation, [({}, value)]))
+            else:
+                families.append((f"{prefix}_{key}", 'gauge', documentation, [({}, value)]))
+        return families
+
+    return collect
+
+
+REGISTRY = MetricsRegistry()
+
+UPDATE_LATENCY = REGISTRY.register(Histogram(
+    'bot_update_duration_seconds', 'Время обработки апдейта по хендлерам', ('handler',)))
+UPDATE_ERRORS = REGISTRY.register(Counter(
+    'bot_update_errors_total', 'Апдейты, обработка которых завершилась исключением', ('handler',)))
+SHEETS_LATENCY = REGISTRY.register(Histogram(
+    'sheets_call_duration_seconds', 'Длительность вызовов Google Sheets', ('method',)))
+SHEETS_CALLS = REGISTRY.register(Counter(
+    'sheets_calls_total', 'Вызовы Google Sheets по результату', ('method', 'status')))
+BOT_API_LATENCY = REGISTRY.register(Histogram(
+    'bot_api_request_duration_seconds', 'Длительность запросов к Bot API', ('method',)))
+BOT_API_ERRORS = REGISTRY.register(Counter(
+    'bot_api_errors_total', 'Запросы к Bot API, завершившиеся ошибкой', ('method', 'error')))
+
+UNHANDLED = 'unhandled'
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешняя middleware апдейтов: измеряет полное время обработки каждого апдейта.
+
+    Имя хендлера становится известно только после выбора хендлера роутером, поэтому
+    его записывает HandlerNameMiddleware в общий для апдейта словарь.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        timing = data['metrics_timing'] = {'handler': UNHANDLED}
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(timing['handler'])
+            raise
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, timing['handler'])
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренняя middleware роутера: передает имя выбранного хендлера в UpdateMetricsMiddleware"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        timing = data.get('metrics_timing')
+        handler_object = data.get('handler')
+        if timing is not None and handler_object is not None:
+            timing['handler'] = getattr(handler_object.callback, '__name__', UNHANDLED)
+        return await handler(event, data)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии Bot: время и ошибки запросов к Bot API по методам"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        method_name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            BOT_API_ERRORS.inc(method_name, type(e).__name__)
+            raise
+        finally:
+            BOT_API_LATENCY.observe(time.perf_counter() - started, method_name)
+
+
+@contextmanager
+def timed_sheets_call(method: str):
+    """Учитывает длительность и результат вызова Google Sheets по имени метода"""
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        SHEETS_LATENCY.observe(time.perf_counter() - started, method)
+        SHEETS_CALLS.inc(method, status)
+
+
+async def start_metrics_server(host: str, port: int, path: str = '/metrics') -> web.AppRunner:
+    """Запускает HTTP-эндпоинт с метриками; возвращает runner для остановки"""
+    async def handle(_request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}{path}")
+    return runner
@@ -0,0 +1,40 @@
+import random
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+# Последние перестановки: повторный расчет для той же попытки и вопроса берется из кэша
+ANSWER_ORDER_CACHE_SIZE = 4096
+
+
+def new_shuffle_seed() -> int:
+    """Случайное зерно перемешивания для новой попытки прохождения теста"""
+    return random.getrandbits(32)
+
+
+@lru_cache(maxsize=ANSWER_ORDER_CACHE_SIZE)
+def answer_order(answer_count: int, shuffle_seed: int, question_id: int) -> Tuple[int, ...]:
+    """Детерминированная перестановка индексов ответов вопроса.
+
+    Зависит только от числа ответов, зерна попытки и ID вопроса; результат кэшируется.
+    """
+    order = list(range(answer_count))
+    # Строковое зерно хэшируется через sha512 и не зависит от PYTHONHASHSEED
+    random.Random(f"{shuffle_seed}:{question_id}").shuffle(order)
+    return tuple(order)
+
+
+def pick_points(click_number: int) -> int:
+    """Баллы за выбор: первый ответ в вопросе дает 3, второй 2, третий 1"""
+    return 3 - (click_number - 1)
+
+
+def add_pick(scores: Dict[str, int], archetype_id: str, click_number: int) -> Dict[str, int]:
+    """Начисляет баллы архетипу за click_number-й выбор в вопросе (изменяет scores)"""
+    scores[archetype_id] = scores.get(archetype_id, 0) + pick_points(click_number)
+    return scores
+
+
+def rank_archetypes(scores: Dict[str, int]) -> List[Tuple[str, int]]:
+    """Архетипы по убыванию баллов; при равенстве сохраняется порядок в scores"""
+    return sorted(scores.items(), key=itemgetter(1), reverse=True)
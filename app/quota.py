@@ -0,0 +1,111 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Коды ответа Google API, после которых запрос повторяется с паузой:
+# таймаут, превышение квоты и ошибки сервера
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не больше capacity в запасе.
+
+    Вызывается из потоков пула AsyncSheetsDB, поэтому ожидание - обычный time.sleep.
+    Токен резервируется под блокировкой, а ждать его поток будет уже без нее.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Забирает один токен, при необходимости ожидая его; возвращает время ожидания"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class SheetsQuota:
+    """Учет и ограничение запросов к Google Sheets API в пределах минутной квоты.
+
+    Каждый HTTP-запрос gspread (метаданные, чтение, запись) сначала получает токен,
+    поэтому всплески обращений растягиваются во времени, а не упираются в 429.
+    Ответы 429/5xx повторяются с экспоненциальной паузой и случайной добавкой.
+    """
+
+    def __init__(self, requests_per_minute: float = 60, burst: float = 10, max_retries: int = 5,
+                 base_delay: float = 1, max_delay: float = 64):
+        self.requests_per_minute = requests_per_minute
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.retries = 0
+        self.errors = 0
+
+    def set_limit(self, requests_per_minute: float):
+        """Меняет лимит (в режиме воркеров квота делится между процессами)"""
+        self.requests_per_minute = requests_per_minute
+        self.bucket.rate = requests_per_minute / 60
+
+    def before_request(self):
+        """Ждет разрешения на запрос и учитывает его"""
+        waited = self.bucket.acquire()
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self._recent.append(now)
+            if waited > 0:
+                self.throttled += 1
+                self.throttle_seconds += waited
+
+    def retry_delay(self, attempt: int, status: Optional[int], retryable: bool = True) -> Optional[float]:
+        """Пауза перед повтором попытки attempt (с 0) или None, если повторять не нужно.
+
+        retryable=False - запрос мог выполниться и повторять его небезопасно.
+        """
+        if (not retryable or attempt >= self.max_retries
+                or (status is not None and status not in RETRY_STATUSES)):
+            with self._lock:
+                self.errors += 1
+            return None
+        with self._lock:
+            self.retries += 1
+        delay = min(self.base_delay * 2 ** attempt, self.max_delay) + random.uniform(0, 1)
+        logging.warning(f"Google Sheets ответил {status or 'ошибкой сети'}, повтор через {delay:.1f} с")
+        return delay
+
+    def requests_last_minute(self) -> int:
+        with self._lock:
+            threshold = time.monotonic() - 60
+            while self._recent and self._recent[0] < threshold:
+                self._recent.popleft()
+            return len(self._recent)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'requests_last_minute': self.requests_last_minute(),
+            'limit_per_minute': self.requests_per_minute,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'throttle_seconds': round(self.throttle_seconds, 3),
+            'retries': self.retries,
+            'errors': self.errors,
+        }
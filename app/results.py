@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+RESULTS_HEADER = [
+    'timestamp', 'user_id', 'gender',
+    'archetype_1', 'archetype_2', 'archetype_3', 'scores',
+]
+
+
+def result_row(user_id: int, gender: str, ranked_scores: List[tuple], timestamp: Optional[datetime] = None) -> list:
+    """Строка листа Results: время, пользователь, пол, топ-3 архетипа и все баллы"""
+    timestamp = timestamp or datetime.now(timezone.utc)
+    top = [archetype_id for archetype_id, _ in ranked_scores[:3]]
+    top += [''] * (3 - len(top))
+    scores: Dict[str, int] = {archetype_id: score for archetype_id, score in ranked_scores}
+    return [
+        timestamp.isoformat(timespec='seconds'),
+        user_id,
+        gender,
+        *top,
+        json.dumps(scores, ensure_ascii=False, separators=(',', ':')),
+    ]
+
+
+class ResultsRecorder:
+    """Буфер результатов прохождения теста с отложенной пакетной записью.
+
+    Хендлер только кладет строку в буфер. Фоновая задача раз в flush_interval секунд
+    (или сразу, как наберется batch_size строк) дописывает весь буфер одним вызовом
+    writer; при ошибке строки возвращаются в буфер и запись повторяется с растущей паузой.
+    """
+
+    def __init__(self, writer: Callable[[list], Awaitable[None]], flush_interval: float = 10,
+                 batch_size: int = 50, max_buffered: int = 10000,
+                 retry_delay: float = 5, max_retry_delay: float = 300):
+        self._writer = writer
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        # При длительной недоступности таблицы теряются самые старые строки, а не память процесса
+        self._buffer = deque(maxlen=max_buffered)
+        self._wakeup = None
+        self._task = None
+        self._failures = 0
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, user_id: int, gender: str, ranked_scores: List[tuple]):
+        """Ставит результат в очередь на запись; не ждет обращения к таблице"""
+        self.add_rows([result_row(user_id, gender, ranked_scores)])
+
+    def add_rows(self, rows: List[list]):
+        """Ставит в очередь готовые строки (например, полученные от других воркеров)"""
+        for row in rows:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+        if len(self._buffer) >= self._batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def set_writer(self, writer: Callable[[list], Awaitable[None]]):
+        """Меняет получателя строк (в режиме воркеров - очередь к воркеру, владеющему таблицей)"""
+        self._writer = writer
+
+    def start(self):
+        """Запускает фоновую запись (вызывается при старте диспетчера)"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и пытается сохранить остаток буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logging.error(f"Не удалось сохранить {len(self._buffer)} результатов при остановке")
+
+    async def _run(self):
+        while True:
+            delay = self._flush_interval
+            if self._failures:
+                delay = min(self._retry_delay * 2 ** (self._failures - 1), self._max_retry_delay)
+            try:
+                # Полный буфер будит задачу раньше, но не во время паузы после ошибки
+                if self._failures:
+                    await asyncio.sleep(delay)
+                else:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Записывает весь буфер одним вызовом; True, если буфер пуст после записи"""
+        if not self._buffer:
+            return True
+        rows = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await self._writer(rows)
+        except Exception as e:
+            self._failures += 1
+            # Возвращаем строки в начало буфера, сохраняя порядок и новые записи
+            free = self._buffer.maxlen - len(self._buffer)
+            self.dropped += max(len(rows) - free, 0)
+            self._buffer.extendleft(reversed(rows[-free:] if free else []))
+            logging.error(f"Не удалось записать {len(rows)} результатов (попытка {self._failures}): {e}")
+            return False
+        self._failures = 0
+        self.written += len(rows)
+        logging.info(f"Записано результатов в таблицу: {len(rows)}")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'buffered': len(self._buffer),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failures': self._failures,
+        }
+
+
+class ResultsForwarder:
+    """Writer ResultsRecorder воркера-читателя: передает строки воркеру, владеющему таблицей"""
+
+    def __init__(self, queue, index: int):
+        self._queue = queue
+        self._index = index
+
+    async def __call__(self, rows: list):
+        self._queue.put(("rows", rows))
+
+    def close(self):
+        """Сообщает, что остаток буфера уже передан (вызывается после остановки ResultsRecorder)"""
+        self._queue.put(("done", self._index))
+
+
+class ResultsIntake:
+    """Прием строк результатов от воркеров-читателей в ResultsRecorder воркера 0.
+
+    В таблицу пишет один процесс, поэтому ревизия таблицы меняется только от его
+    собственных записей. При остановке ждет, пока остальные воркеры передадут остаток
+    своих буферов (не дольше stop_timeout секунд).
+    """
+
+    def __init__(self, queue, recorder: ResultsRecorder, senders: int, stop_timeout: float = 15):
+        self._queue = queue
+        self._recorder = recorder
+        self._senders = senders
+        self._stop_timeout = stop_timeout
+        self._done = set()
+        self._task = None
+        self.received = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Очередь multiprocessing блокирующая: ждем ее в потоке, не в event loop
+            message = await loop.run_in_executor(None, self._queue.get)
+            if message is None:
+                return
+            kind, payload = message
+            if kind == "rows":
+                self._recorder.add_rows(payload)
+                self.received += len(payload)
+            elif kind == "done":
+                self._done.add(payload)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._stop_timeout
+        while len(self._done) < self._senders and loop.time() < deadline and not self._task.done():
+            await asyncio.sleep(0.1)
+        if len(self._done) < self._senders:
+            logging.warning(f"Не все воркеры передали результаты до остановки: {len(self._done)} из {self._senders}")
+        # None освобождает поток, ожидающий очередь
+        self._queue.put(None)
+        await self._task
+        self._task = None
@@ -0,0 +1,99 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, Hashable, Optional, Tuple
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+# Объекты апдейта без собственного chat, у которых чат берется из вложенного сообщения (callback_query)
+_NESTED_MESSAGE_KEYS = ("message",)
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """ID чата апдейта (для callback-запросов - чат сообщения с кнопкой, иначе пользователь)"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat")
+        if chat is None:
+            for nested_key in _NESTED_MESSAGE_KEYS:
+                nested = payload.get(nested_key)
+                if isinstance(nested, dict) and "chat" in nested:
+                    chat = nested["chat"]
+                    break
+        if chat is not None:
+            return chat.get("id")
+        user = payload.get("from") or payload.get("user")
+        if user is not None:
+            return user.get("id")
+    return None
+
+
+class KeyedLocks:
+    """Блокировки по ключу, которые существуют, только пока их кто-то держит или ждет.
+
+    Блокировки выдаются в порядке запроса, так что память не растет с числом ключей.
+    Ключ None блокировку не берет.
+    """
+
+    def __init__(self):
+        # ключ -> [блокировка, число владельцев и ожидающих]
+        self._locks: Dict[Hashable, list] = {}
+        self.waited = 0
+
+    @asynccontextmanager
+    async def lock(self, key: Optional[Hashable]) -> AsyncGenerator[None, None]:
+        if key is None:
+            yield
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        if entry[0].locked():
+            self.waited += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'active_chats': len(self._locks),
+            'queued_updates': sum(users - 1 for _, users in self._locks.values()),
+            'waited': self.waited,
+        }
+
+    def clear(self):
+        self._locks.clear()
+
+
+class ChatEventIsolation(BaseEventIsolation):
+    """Последовательная обработка апдейтов одного чата при параллельной обработке разных чатов.
+
+    Подключается в Dispatcher(events_isolation=...): FSMContextMiddleware берет блокировку
+    до чтения состояния и держит ее до конца хендлера, поэтому read-modify-write данных
+    FSM (click_count, scores) в одном чате не пересекается. Блокировки выдаются в порядке
+    поступления апдейтов и удаляются, как только у чата не остается ожидающих апдейтов,
+    так что память не растет с числом пользователей.
+    """
+
+    def __init__(self):
+        self._locks = KeyedLocks()
+
+    @staticmethod
+    def _chat_key(key: StorageKey) -> Tuple[int, int]:
+        return key.bot_id, key.chat_id
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        async with self._locks.lock(self._chat_key(key)):
+            yield
+
+    def stats(self) -> Dict[str, int]:
+        return self._locks.stats()
+
+    async def close(self) -> None:
+        self._locks.clear()
@@ -0,0 +1,41 @@
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def save_snapshot(path: str, sheets: Dict[str, List[list]]):
+    """Атомарно сохраняет значения листов в сжатый JSON-файл"""
+    payload = {
+        'format': SNAPSHOT_FORMAT_VERSION,
+        'saved_at': time.time(),
+        'sheets': sheets,
+    }
+    data = gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    logging.info(f"Снимок контента сохранен в {path} ({len(data)} байт)")
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, List[list]]]:
+    """Загружает значения листов из снимка; None, если снимка нет или он поврежден"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            payload = json.loads(gzip.decompress(f.read()).decode('utf-8'))
+        if payload.get('format') != SNAPSHOT_FORMAT_VERSION:
+            logging.warning(f"Снимок контента {path} имеет неизвестный формат, пропускаем")
+            return None
+        age = time.time() - payload.get('saved_at', 0)
+        logging.info(f"Загружен снимок контента {path} (возраст {age:.0f} с)")
+        return payload['sheets']
+    except Exception as e:
+        logging.error(f"Не удалось прочитать снимок контента {path}: {e}")
+        return None
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    """Компактная сериализация данных состояния"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в SQLite (WAL) с кэшем записей в памяти и пакетной записью.
+
+    Чтение идет из кэша, изменения копятся в памяти и записываются на диск одной
+    транзакцией раз в flush_interval секунд, поэтому частые update_data во время
+    викторины почти не стоят обращений к диску.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, max_cached: int = 10000,
+                 key_builder: Optional[KeyBuilder] = None):
+        self._path = path
+        self._flush_interval = flush_interval
+        self._max_cached = max_cached
+        self._key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        # Все операции с соединением выполняются в одном потоке
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._connection = None
+        # key -> [state, data]
+        self._records: "OrderedDict[str, list]" = OrderedDict()
+        self._dirty = set()
+        self._flush_task = None
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self._path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}')"
+            )
+            connection.commit()
+            self._connection = connection
+            logging.info(f"FSM-хранилище SQLite открыто: {self._path}")
+        return self._connection
+
+    def _read(self, key: str) -> list:
+        row = self._open().execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return [None, {}]
+        return [row[0], json.loads(row[1])]
+
+    def _write(self, rows: list):
+        connection = self._open()
+        with connection:
+            connection.executemany(
+                "INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data",
+                [row for row in rows if row[1] is not None or row[2] != '{}'],
+            )
+            connection.executemany(
+                "DELETE FROM fsm WHERE key = ?",
+                [(row[0],) for row in rows if row[1] is None and row[2] == '{}'],
+            )
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _record(self, key: StorageKey) -> list:
+        storage_key = self._key_builder.build(key)
+        record = self._records.get(storage_key)
+        if record is None:
+            record = await self._run(self._read, storage_key)
+            # Запись могла появиться, пока шло чтение с диска
+            record = self._records.setdefault(storage_key, record)
+        self._records.move_to_end(storage_key)
+        return record
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(self._key_builder.build(key))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        # Изменения, сделанные во время записи, попадают в следующую итерацию:
+        # пока задача жива, _mark_dirty новую не запускает
+        while self._dirty:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        rows = [(key, self._records[key][0], _dumps(self._records[key][1])) for key in keys]
+        try:
+            await self._run(self._write, rows)
+        except Exception as e:
+            logging.error(f"Не удалось записать FSM-состояния в SQLite: {e}")
+            self._dirty.update(keys)
+            return
+        self._evict()
+
+    def _evict(self):
+        """Удаляет из памяти давно не использованные записи, уже сохраненные на диск"""
+        while len(self._records) > self._max_cached:
+            key = next(iter(self._records))
+            if key in self._dirty:
+                break
+            del self._records[key]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record[1] = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key))[1].copy()
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if self._connection is not None:
+            await self._run(self._connection.close)
+        self._executor.shutdown(wait=True)
+
+
+def create_storage(kind: str, sqlite_path: str = "fsm.sqlite3", redis_url: Optional[str] = None,
+                   flush_interval: float = 1.0) -> BaseStorage:
+    """Создает FSM-хранилище по настройке FSM_STORAGE: memory, sqlite или redis"""
+    if kind == "sqlite":
+        logging.info(f"FSM-хранилище: SQLite ({sqlite_path})")
+        return SQLiteStorage(sqlite_path, flush_interval=flush_interval)
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("FSM_REDIS_URL не указан для FSM_STORAGE=redis")
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            logging.error("Для FSM_STORAGE=redis установите пакет redis: pip install redis")
+            raise
+        logging.info("FSM-хранилище: Redis-совместимый сервер")
+        return RedisStorage.from_url(
+            redis_url,
+            key_builder=DefaultKeyBuilder(with_destiny=True),
+            json_dumps=_dumps,
+        )
+    if kind != "memory":
+        logging.warning(f"Неизвестный тип FSM-хранилища '{kind}', используем memory")
+    logging.info("FSM-хранилище: память процесса (состояния теряются при перезапуске)")
+    return MemoryStorage()
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Правки и удаление сообщений, на которые пользователь ждет реакции, идут вне очереди
+INTERACTIVE_METHODS = frozenset({
+    "EditMessageReplyMarkup",
+    "EditMessageText",
+    "EditMessageCaption",
+    "DeleteMessage",
+})
+
+
+class SendScheduler:
+    """Планировщик исходящих запросов с учетом лимитов Telegram.
+
+    Глобальный token bucket ограничивает число запросов в секунду, а отправки в
+    один чат разносятся не менее чем на per_chat_interval секунд. Ожидающие
+    запросы обслуживаются по приоритету: сначала интерактивные правки.
+    """
+
+    def __init__(self, rate: float = 25, burst: Optional[float] = None, per_chat_interval: float = 0.5):
+        self.rate = rate
+        self.burst = burst or rate
+        self.per_chat_interval = per_chat_interval
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._drain_task = None
+        self._chat_next_at: Dict[int, float] = {}
+        self.retries = 0
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def pause(self, seconds: float):
+        """Приостанавливает все отправки (после ответа 429 с retry_after)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _wait_chat_slot(self, chat_id: int):
+        now = time.monotonic()
+        next_at = self._chat_next_at.get(chat_id, 0.0)
+        self._chat_next_at[chat_id] = max(now, next_at) + self.per_chat_interval
+        if len(self._chat_next_at) > 10000:
+            self._chat_next_at = {key: value for key, value in self._chat_next_at.items() if value > now}
+        if next_at > now:
+            self.throttled += 1
+            await asyncio.sleep(next_at - now)
+
+    async def acquire(self, chat_id=None, priority: int = PRIORITY_BULK):
+        """Дожидается разрешения на отправку запроса"""
+        if chat_id is not None and priority == PRIORITY_BULK:
+            await self._wait_chat_slot(chat_id)
+
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and self._tokens >= 1 and now >= self._paused_until:
+            self._tokens -= 1
+            return
+
+        self.throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.ensure_future(self._drain())
+        await future
+
+    async def _drain(self):
+        """Выдает токены ожидающим запросам в порядке приоритета"""
+        while self._waiters:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._tokens -= 1
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        """Глубина очереди по приоритетам и счетчики ожиданий"""
+        interactive = sum(1 for priority, _, _ in self._waiters if priority == PRIORITY_INTERACTIVE)
+        return {
+            'queue_interactive': interactive,
+            'queue_bulk': len(self._waiters) - interactive,
+            'throttled': self.throttled,
+            'retries': self.retries,
+        }
+
+
+class FloodControlMiddleware(BaseRequestMiddleware):
+    """Middleware сессии Bot: пропускает запросы через SendScheduler и повторяет их после 429"""
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int = 3):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery, setWebhook и т.п. не ограничиваются
+            return await make_request(bot, method)
+
+        method_name = type(method).__name__
+        priority = PRIORITY_INTERACTIVE if method_name in INTERACTIVE_METHODS else PRIORITY_BULK
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.scheduler.retries += 1
+                self.scheduler.pause(e.retry_after)
+                logging.warning(f"Flood control на {method_name} (чат {chat_id}), повтор через {e.retry_after} с")
@@ -0,0 +1,114 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Any, Callable, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+
+from app.sequencing import KeyedLocks, update_chat_id
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler:
+    """Принимает апдейты от Telegram по HTTP.
+
+    Сразу отвечает 200 и обрабатывает апдейт в фоне; одновременно обрабатывается
+    не более max_concurrency апдейтов, остальные ждут своей очереди. Апдейты одного чата
+    ждут друг друга до получения слота, чтобы не занимать слоты, пока чат обрабатывается.
+    Если задан forward, апдейт не обрабатывается, а передается как есть (режим воркеров).
+    """
+
+    def __init__(self, dispatcher: Optional[Dispatcher], bot: Bot, secret_token: Optional[str] = None,
+                 max_concurrency: int = 100, forward: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.forward = forward
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chats = KeyedLocks()
+        self._tasks = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                logging.warning(f"Webhook: неверный секретный токен от {request.remote}")
+                return web.Response(status=401)
+
+        if self.forward is not None:
+            try:
+                self.forward(await request.json())
+            except Exception as e:
+                logging.warning(f"Webhook: некорректный апдейт: {e}")
+                return web.Response(status=400)
+            return web.Response(status=200)
+
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except Exception as e:
+            logging.warning(f"Webhook: некорректный апдейт: {e}")
+            return web.Response(status=400)
+
+        task = asyncio.create_task(self._process(update, update_chat_id(data)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, update: Update, chat_id: Optional[int]):
+        async with self._chats.lock(chat_id), self._semaphore:
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception as e:
+                logging.error(f"Webhook: ошибка обработки апдейта {update.update_id}: {e}")
+
+    async def wait_pending(self, timeout: float = 10):
+        """Дожидается обработки уже принятых апдейтов при остановке"""
+        if self._tasks:
+            logging.info(f"Webhook: ожидаем обработки {len(self._tasks)} апдейтов")
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def register(self, app: web.Application, path: str):
+        app.router.add_post(path, self.handle)
+
+
+async def run_webhook(dispatcher: Optional[Dispatcher], bot: Bot, host: str, port: int, path: str,
+                      secret_token: Optional[str] = None, max_concurrency: int = 100,
+                      forward: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """Запускает встроенный aiohttp-сервер для приема апдейтов и работает до отмены"""
+    handler = WebhookHandler(dispatcher, bot, secret_token=secret_token, max_concurrency=max_concurrency,
+                             forward=forward)
+    app = web.Application()
+    handler.register(app, path)
+
+    async def on_shutdown(_app: web.Application):
+        await handler.wait_pending()
+
+    app.on_shutdown.append(on_shutdown)
+    if dispatcher is not None:
+        # В режиме воркеров startup/shutdown диспетчеров выполняются в самих воркерах
+        setup_application(app, dispatcher, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook-сервер слушает {host}:{port}{path} (до {max_concurrency} апдейтов одновременно)")
+    # SIGTERM (перезапуск контейнера) и Ctrl+C завершают сервер штатно: принятые апдейты
+    # дообрабатываются и выполняются shutdown-хуки (запись результатов, FSM, воронки)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stop_event.set)
+    try:
+        await stop_event.wait()
+        logging.info("Webhook-сервер: получен сигнал остановки")
+    finally:
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signal_number)
+        await runner.cleanup()
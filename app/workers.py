@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_module
+import signal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from app.sequencing import KeyedLocks, update_chat_id
+
+QUEUE_BATCH_SIZE = 100
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+
+# (номер воркера, число воркеров, общая очередь результатов) -> Bot, Dispatcher
+AppFactory = Callable[[int, int, Any], Tuple[Bot, Dispatcher]]
+
+
+def shard_for(chat_id: Optional[int], workers: int) -> int:
+    """Номер воркера для чата: апдейты одного чата всегда попадают в один процесс"""
+    return hash(chat_id) % workers if chat_id is not None else 0
+
+
+def worker_file_path(path: str, index: int) -> str:
+    """Путь к файлу отдельного воркера: funnel.json -> funnel.w1.json"""
+    base, dot, extension = path.rpartition(".")
+    return f"{base}.w{index}.{extension}" if dot else f"{path}.w{index}"
+
+
+class ShardedDispatcher:
+    """Процесс-приемник: раздает сырые апдейты N процессам-воркерам по ID чата.
+
+    Каждый воркер - отдельный процесс со своим event loop, Bot и Dispatcher, поэтому
+    разбор JSON, клавиатуры и работа FSM распределяются по ядрам. Апдейты одного чата
+    обрабатывает один и тот же воркер, что сохраняет порядок действий пользователя.
+    Общая очередь results позволяет воркерам передавать результаты воркеру 0,
+    единственному процессу, который обращается к Google Sheets.
+    """
+
+    def __init__(self, workers: int, app_factory: AppFactory, max_concurrency: int = 100):
+        self.workers = workers
+        # spawn: дочерний процесс не наследует event loop, потоки и соединения приемника
+        context = multiprocessing.get_context("spawn")
+        self._queues = [context.Queue() for _ in range(workers)]
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=worker_main,
+                args=(index, workers, self._queues[index], self._results, app_factory, max_concurrency),
+                name=f"bot-worker-{index}",
+                daemon=True,
+            )
+            for index in range(workers)
+        ]
+        self.submitted = [0] * workers
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+        logging.info(f"Запущено воркеров: {self.workers}")
+
+    def submit(self, update: Dict[str, Any]):
+        index = shard_for(update_chat_id(update), self.workers)
+        self.submitted[index] += 1
+        self._queues[index].put(update)
+
+    def stop(self, timeout: float = 30):
+        """Просит воркеров завершить обработку принятых апдейтов и дожидается их"""
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logging.warning(f"Воркер {process.name} не завершился за {timeout} с, останавливаем")
+                process.terminate()
+        logging.info("Все воркеры остановлены")
+
+
+async def get_raw_updates(bot: Bot, params: Dict[str, Any], request_timeout: float) -> List[Dict[str, Any]]:
+    """getUpdates без разбора в модели aiogram: приемнику нужен только JSON для воркеров"""
+    session = await bot.session.create_session()
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    async with session.post(url, json=params, timeout=aiohttp.ClientTimeout(total=request_timeout)) as response:
+        payload = await response.json(loads=bot.session.json_loads, content_type=None)
+    if not payload.get("ok"):
+        raise RuntimeError(f"Telegram ответил {payload.get('error_code')}: {payload.get('description')}")
+    return payload["result"]
+
+
+async def poll_updates(bot: Bot, submit: Callable[[Dict[str, Any]], None],
+                       allowed_updates: Optional[List[str]] = None, polling_timeout: int = 30):
+    """Long polling в процессе-приемнике: апдейты не обрабатываются, а передаются воркерам.
+
+    Апдейты пересылаются как есть, без разбора в модели: приемник один, и вся работа
+    с моделями aiogram выполняется в воркерах. Работает до SIGTERM или SIGINT; при
+    остановке подтверждает Telegram уже переданные апдейты, чтобы после перезапуска
+    они не пришли повторно.
+    """
+    backoff = Backoff(config=POLLING_BACKOFF)
+    params: Dict[str, Any] = {"timeout": polling_timeout}
+    if allowed_updates is not None:
+        params["allowed_updates"] = allowed_updates
+    request_timeout = (bot.session.timeout or 60) + polling_timeout
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in STOP_SIGNALS:
+        loop.add_signal_handler(signal_number, stop_event.set)
+    stop_waiter = asyncio.ensure_future(stop_event.wait())
+    try:
+        while not stop_event.is_set():
+            request = asyncio.ensure_future(get_raw_updates(bot, params, request_timeout))
+            await asyncio.wait({request, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if not request.done():
+                request.cancel()
+                break
+            try:
+                updates = request.result()
+            except Exception as e:
+                logging.error(f"Не удалось получить апдейты: {type(e).__name__}: {e}")
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            for update in updates:
+                submit(update)
+                params["offset"] = update["update_id"] + 1
+        logging.info("Приемник: получен сигнал остановки")
+        if "offset" in params:
+            try:
+                await get_raw_updates(bot, {"offset": params["offset"], "timeout": 0, "limit": 1},
+                                      request_timeout)
+            except Exception as e:
+                logging.warning(f"Не удалось подтвердить полученные апдейты: {e}")
+    finally:
+        stop_waiter.cancel()
+        for signal_number in STOP_SIGNALS:
+            loop.remove_signal_handler(signal_number)
+
+
+class WorkerRunner:
+    """Обработка апдейтов в процессе-воркере: не более max_concurrency одновременно.
+
+    Апдейты одного чата обрабатываются по очереди: блокировка чата берется до слота
+    семафора, поэтому ожидающие апдейты занятого чата не отнимают слоты у других чатов.
+    """
+
+    def __init__(self, bot: Bot, dispatcher: Dispatcher, max_concurrency: int = 100):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chats = KeyedLocks()
+        self._tasks = set()
+
+    def schedule(self, update: Dict[str, Any]):
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: Dict[str, Any]):
+        async with self._chats.lock(update_chat_id(update)), self._semaphore:
+            try:
+                await self.dispatcher.feed_raw_update(self.bot, update)
+            except Exception as e:
+                logging.error(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+    async def wait_pending(self):
+        if self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+
+async def _run_worker(index: int, workers: int, queue, results, app_factory: AppFactory, max_concurrency: int):
+    bot, dispatcher = app_factory(index, workers, results)
+    runner = WorkerRunner(bot, dispatcher, max_concurrency)
+    loop = asyncio.get_running_loop()
+    # SIGTERM: дообработать принятые апдейты и выполнить shutdown-хуки (как сигнал приемника)
+    loop.add_signal_handler(signal.SIGTERM, queue.put, None)
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher, bots=[bot])
+    logging.info(f"Воркер {index} готов к обработке апдейтов")
+    try:
+        stopping = False
+        while not stopping:
+            # Ждем первый апдейт в потоке, остальные уже накопившиеся забираем без ожидания
+            batch = [await loop.run_in_executor(None, queue.get)]
+            try:
+                while len(batch) < QUEUE_BATCH_SIZE:
+                    batch.append(queue.get_nowait())
+            except queue_module.Empty:
+                pass
+            for update in batch:
+                if update is None:
+                    stopping = True
+                    break
+                runner.schedule(update)
+        # Апдейты, успевшие попасть в очередь после сигнала остановки
+        try:
+            while True:
+                update = queue.get_nowait()
+                if update is not None:
+                    runner.schedule(update)
+        except queue_module.Empty:
+            pass
+        await runner.wait_pending()
+    finally:
+        await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher, bots=[bot])
+        await bot.session.close()
+        logging.info(f"Воркер {index} остановлен")
+
+
+def worker_main(index: int, workers: int, queue, results, app_factory: AppFactory, max_concurrency: int):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C в терминале обрабатывает приемник и останавливает воркеры через очередь;
+    # SIGTERM (остановка контейнера) воркер обрабатывает сам, дообработав принятые апдейты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"[w{index}] %(levelname)s:%(name)s:%(message)s")
+    asyncio.run(_run_worker(index, workers, queue, results, app_factory, max_concurrency))
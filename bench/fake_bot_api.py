@@ -0,0 +1,68 @@
+"""Заглушка Bot API для нагрузочного теста: принимает запросы aiogram и отвечает как Telegram"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot"}
+
+# Методы, которые возвращают отправленное сообщение
+MESSAGE_METHODS = frozenset({
+    "sendmessage", "sendphoto", "sendvideo", "senddocument", "sendanimation", "sendaudio",
+})
+
+
+class FakeBotAPI:
+    """Локальный HTTP-сервер, совместимый с TelegramAPIServer.from_base.
+
+    latency - искусственная задержка ответа в секундах, чтобы приблизить
+    замеры к работе с настоящим Bot API.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getme":
+            result = BOT_USER
+        elif method in MESSAGE_METHODS:
+            chat_id = int(form.get("chat_id", 0))
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": form.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> str:
+        """Запускает сервер и возвращает базовый URL для TelegramAPIServer.from_base"""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,96 @@
+"""Контент викторины в памяти по схеме docs/worksheet-schemas.md.
+
+Используется нагрузочным тестом и микробенчмарками вместо Google Sheets.
+"""
+from typing import Dict, List
+
+from app.backends import ContentBackend
+from app.content import CONFIG_SHEET, SUPPORTED_GENDERS, gender_sheet_name
+
+QUESTION_COUNT = 19
+ANSWERS_PER_QUESTION = 6
+
+ARCHETYPES = (
+    ("introvert", "🌙 Интроверт", "Вы черпаете энергию из внутреннего мира."),
+    ("extrovert", "☀️ Экстраверт", "Вы получаете энергию от общения с людьми."),
+    ("creator", "🎨 Творец", "Вы видите мир через призму возможностей для творчества."),
+    ("explorer", "🗺️ Исследователь", "Вас влечет неизвестное и новые горизонты."),
+    ("caregiver", "💝 Заботливый", "Вы находите смысл в помощи другим людям."),
+    ("ruler", "👑 Правитель", "Вы прирожденный лидер с четким видением будущего."),
+)
+
+CONFIG_VALUES = {
+    "welcome_sequence_1": "Добро пожаловать в тест архетипов!",
+    "welcome_sequence_2": "Узнайте свой тип личности за 5 минут",
+    "promo_sequence": "Готовы начать увлекательное путешествие?\\nОтветьте на 19 вопросов и откройте свой архетип!",
+    "promo_button_text": "🚀 Начать тест",
+    "instruction_sequence": "<b>Инструкция:</b>\\n\\nДля каждого вопроса выберите <b>3 варианта из 6</b>.",
+    "start_button_text": "✨ Начать викторину",
+    "final_cta_text": "🎉 Тест завершен!\\n\\nВаши результаты готовы. Хотите узнать свой архетип?",
+    "final_cta_button": "📊 Показать результаты",
+    "final_proposition": "Получите персональный разбор вашего архетипа",
+    "final_pdf_url": "https://example.com/report.pdf",
+    "final_video_url": "https://example.com/video.mp4",
+    "payment_url": "https://example.com/payment",
+    "payment_button_text": "💳 Получить полный отчет",
+    "final_message_text": "🎯 <b>Хотите узнать больше?</b>\\n\\nПолучите расширенный анализ вашего архетипа!",
+}
+
+
+def questions_rows(gender: str, question_count: int = QUESTION_COUNT) -> List[list]:
+    rows = [["question_id", "question_text", "prompt_text"]]
+    for qid in range(1, question_count + 1):
+        rows.append([str(qid), f"Вопрос {qid} ({gender}): как вы поступите в этой ситуации?",
+                     "Выберите 3 наиболее подходящих варианта"])
+    return rows
+
+
+def answers_rows(gender: str, question_count: int = QUESTION_COUNT,
+                 answers_per_question: int = ANSWERS_PER_QUESTION) -> List[list]:
+    rows = [["answer_id", "question_id", "answer_text", "archetype_id"]]
+    answer_id = 1
+    for qid in range(1, question_count + 1):
+        for index in range(answers_per_question):
+            archetype_id = ARCHETYPES[index % len(ARCHETYPES)][0]
+            rows.append([str(answer_id), str(qid),
+                         f"Вариант {index + 1} вопроса {qid} ({gender}) — {archetype_id}", archetype_id])
+            answer_id += 1
+    return rows
+
+
+def archetypes_rows(gender: str) -> List[list]:
+    rows = [["archetype_id", "main_description", "secondary_description"]]
+    for archetype_id, title, description in ARCHETYPES:
+        rows.append([archetype_id, f"<b>{title}</b>\\n\\n{description} ({gender})", description])
+    return rows
+
+
+def config_rows() -> List[list]:
+    return [["key", "value"]] + [[key, value] for key, value in CONFIG_VALUES.items()]
+
+
+def sample_sheet_values(question_count: int = QUESTION_COUNT,
+                        answers_per_question: int = ANSWERS_PER_QUESTION) -> Dict[str, List[list]]:
+    """Значения всех листов объединенной таблицы в формате values_batch_get"""
+    values = {CONFIG_SHEET: config_rows()}
+    for gender in SUPPORTED_GENDERS:
+        values[gender_sheet_name("Questions", gender)] = questions_rows(gender, question_count)
+        values[gender_sheet_name("Answers", gender)] = answers_rows(gender, question_count, answers_per_question)
+        values[gender_sheet_name("Archetypes", gender)] = archetypes_rows(gender)
+    return values
+
+
+class FakeSheetsDB(ContentBackend):
+    """Источник контента в памяти для AsyncSheetsDB: отдает листы и копит записи"""
+
+    def __init__(self, values: Dict[str, List[list]] = None):
+        self.values = values or sample_sheet_values()
+        self.appended: Dict[str, List[list]] = {}
+        self.fetches = 0
+
+    def fetch_values(self, sheet_names) -> Dict[str, List[list]]:
+        self.fetches += 1
+        return {name: self.values.get(name, []) for name in sheet_names}
+
+    def append_rows(self, sheet_name: str, rows: list, header: list = None):
+        self.appended.setdefault(sheet_name, []).extend(rows)
@@ -0,0 +1,244 @@
+"""Нагрузочный тест: N синтетических пользователей проходят викторину целиком.
+
+Бот работает со своими настоящими хендлерами и FSM, но вместо Telegram отвечает
+локальная заглушка Bot API, а вместо Google Sheets - контент из памяти.
+
+Запуск из корня репозитория:
+    python -m bench.loadtest --users 200 --skip-pauses
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from functools import partial
+from typing import Dict, List
+
+os.environ.setdefault("BOT_TOKEN", "42:load-test")
+os.environ.setdefault("SPREADSHEET_KEY", "load-test")
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from app import delivery as delivery_module, handlers
+from app.async_db import AsyncSheetsDB
+from app.results import RESULTS_HEADER, ResultsRecorder
+from app.sequencing import ChatEventIsolation
+from app.storage import create_storage
+from app.throttling import FloodControlMiddleware, SendScheduler
+from bench.fake_bot_api import FakeBotAPI
+from bench.fixtures import QUESTION_COUNT, FakeSheetsDB
+
+BOT_TOKEN = os.environ["BOT_TOKEN"]
+
+
+class _NoPauses:
+    """Подменяет asyncio в модуле хендлеров: паузы между сообщениями не ждут"""
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    @staticmethod
+    async def sleep(delay, result=None):
+        await asyncio.sleep(0)
+        return result
+
+
+class UpdateFactory:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def _message(self, user_id: int, text: str = None, from_bot: bool = False) -> dict:
+        message = {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Bot"} if from_bot else self._user(user_id),
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def command(self, user_id: int, text: str) -> Update:
+        message = self._message(user_id, text)
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.model_validate(
+            {"update_id": next(self._update_ids), "message": message}, context={"bot": self.bot})
+
+    def callback(self, user_id: int, data: str) -> Update:
+        callback_query = {
+            "id": str(next(self._update_ids)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": self._message(user_id, "…", from_bot=True),
+        }
+        return Update.model_validate(
+            {"update_id": next(self._update_ids), "callback_query": callback_query}, context={"bot": self.bot})
+
+
+def session_script(factory: UpdateFactory, user_id: int, gender: str):
+    """Шаги одного прохождения: (название шага, апдейт)"""
+    yield "start", factory.command(user_id, "/start")
+    yield "gender", factory.callback(user_id, f"gender:{gender}")
+    yield "promo", factory.callback(user_id, "start_instructions")
+    yield "instructions", factory.callback(user_id, "start_quiz_now")
+    for question_id in range(1, QUESTION_COUNT + 1):
+        for num in (1, 2, 3):
+            yield "answer", factory.callback(user_id, f"ans_num:{question_id}:{num}")
+    yield "results", factory.callback(user_id, "show_final_result")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run(args) -> dict:
+    fake_api = FakeBotAPI(latency=args.api_latency / 1000)
+    base_url = await fake_api.start()
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    if args.flood_control:
+        bot.session.middleware(FloodControlMiddleware(SendScheduler()))
+
+    # Хендлеры обращаются к модульным объектам, поэтому подменяем их до первого апдейта
+    sheets = FakeSheetsDB()
+    handlers.global_db = AsyncSheetsDB(lambda: sheets, snapshot_path=None)
+    handlers.results_recorder = ResultsRecorder(
+        partial(handlers.global_db.append_rows, "Results", header=RESULTS_HEADER), flush_interval=1)
+    if args.skip_pauses:
+        handlers.asyncio = _NoPauses()
+        delivery_module.asyncio = _NoPauses()
+    await handlers.global_db.content()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    storage = create_storage(args.storage, os.path.join(tmp_dir.name, "fsm.sqlite3"))
+    dp = Dispatcher(storage=storage, events_isolation=ChatEventIsolation())
+    dp.include_router(handlers.router)
+    handlers.results_recorder.start()
+
+    factory = UpdateFactory(bot)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    completed = 0
+
+    async def user_session(index: int):
+        nonlocal errors, completed
+        await asyncio.sleep(args.ramp * index / max(args.users, 1))
+        user_id = 100000 + index
+        gender = "male" if index % 2 else "female"
+        for step, update in session_script(factory, user_id, gender):
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors += 1
+                logging.error(f"Пользователь {user_id}, шаг {step}: {e}")
+                return
+            latencies[step].append(time.perf_counter() - started)
+            if args.think:
+                await asyncio.sleep(args.think)
+        completed += 1
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.trace_memory:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(index) for index in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    memory_after = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+    if args.trace_memory:
+        tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    await handlers.results_recorder.stop()
+    await handlers.markup_debouncer.stop()
+    await handlers.delivery.stop()
+    await dp.storage.close()
+    await bot.session.close()
+    await fake_api.stop()
+    handlers.global_db.close()
+    tmp_dir.cleanup()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = {
+        "users": args.users,
+        "completed": completed,
+        "errors": errors,
+        "updates": len(all_latencies),
+        "elapsed_seconds": round(elapsed, 3),
+        "updates_per_second": round(len(all_latencies) / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            step: {
+                "p50": round(percentile(values, 0.5) * 1000, 2),
+                "p99": round(percentile(values, 0.99) * 1000, 2),
+                "mean": round(statistics.fmean(values) * 1000, 2),
+            }
+            for step, values in [("all", all_latencies)] + sorted(latencies.items())
+        },
+        "bot_api_calls": sum(fake_api.calls.values()),
+        "results_rows": len(sheets.appended.get("Results", [])),
+        # ru_maxrss в Linux - в килобайтах
+        "rss_growth_kb_per_session": round((rss_after - rss_before) / max(args.users, 1), 2),
+    }
+    if args.trace_memory:
+        report["traced_bytes_per_session"] = round((memory_after - memory_before) / max(args.users, 1))
+    return report
+
+
+def print_report(report: dict):
+    print(f"Пользователей: {report['users']}, завершили: {report['completed']}, ошибок: {report['errors']}")
+    print(f"Апдейтов: {report['updates']} за {report['elapsed_seconds']} с "
+          f"({report['updates_per_second']} апдейтов/с), запросов к Bot API: {report['bot_api_calls']}")
+    print(f"Строк в листе Results: {report['results_rows']}")
+    print(f"{'шаг':<14}{'p50, мс':>10}{'p99, мс':>10}{'mean, мс':>10}")
+    for step, values in report["latency_ms"].items():
+        print(f"{step:<14}{values['p50']:>10}{values['p99']:>10}{values['mean']:>10}")
+    print(f"Рост RSS на сессию: {report['rss_growth_kb_per_session']} КБ")
+    if "traced_bytes_per_session" in report:
+        print(f"Память Python на сессию (tracemalloc): {report['traced_bytes_per_session']} байт")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с заглушками Telegram и Google Sheets")
+    parser.add_argument("--users", type=int, default=100, help="число одновременных пользователей")
+    parser.add_argument("--ramp", type=float, default=0.0, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между нажатиями, с")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа заглушки Bot API, мс")
+    parser.add_argument("--storage", default="memory", choices=("memory", "sqlite"), help="FSM-хранилище")
+    parser.add_argument("--skip-pauses", action="store_true", help="не ждать паузы между сообщениями в хендлерах")
+    parser.add_argument("--flood-control", action="store_true", help="включить SendScheduler, как в main.py")
+    parser.add_argument("--trace-memory", action="store_true", help="измерять память через tracemalloc (медленнее)")
+    parser.add_argument("--json", help="сохранить отчет в JSON-файл")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report["errors"] == 0 and report["completed"] == report["users"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
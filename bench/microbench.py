@@ -0,0 +1,141 @@
+"""Микробенчмарки горячего пути викторины: клавиатура, текст вопроса, баллы, итоги.
+
+Работают без сети на контенте из bench/fixtures.py. Результаты сравниваются с
+bench/baseline.json; замедление больше допуска считается регрессией (код выхода 1).
+
+Запуск из корня репозитория:
+    python -m bench.microbench                     # сравнить с baseline
+    python -m bench.microbench --update-baseline   # записать новый baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Callable, Dict
+
+from app.content import build_content
+from app.keyboards import generate_answers_keyboard
+from app.quiz import add_pick, answer_order, rank_archetypes
+from bench.fixtures import ARCHETYPES, sample_sheet_values
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.5
+
+SEED = 123456789
+QUESTION_ID = 7
+
+
+def build_benchmarks() -> Dict[str, Callable[[], object]]:
+    """Набор замеров: имя -> функция без аргументов, вызываемая многократно"""
+    values = sample_sheet_values()
+    content = build_content(values)
+    gender_content = content.for_gender("male")
+    answers = gender_content.answers_by_question[QUESTION_ID]
+    template = gender_content.templates[QUESTION_ID]
+    order = answer_order(len(answers), SEED, QUESTION_ID)
+    scores = {archetype_id: (index * 7) % 11 for index, (archetype_id, _, _) in enumerate(ARCHETYPES)}
+    picked_archetype = answers[order[1]].archetype_id
+    shown_ids = [template.answer_ids[index] for index in order]
+    seeds = iter(range(10 ** 9))
+
+    def click_resolve():
+        # Сопоставление нажатой кнопки с ответом, как в callback_answer_handler
+        question_answers = gender_content.answers_by_question.get(QUESTION_ID, ())
+        selected_id = shown_ids[2]
+        return next(answer for answer in question_answers if answer.answer_id == selected_id)
+
+    return {
+        # Клавиатура вопроса: до выбора и после двух выборов
+        "keyboard_initial": lambda: generate_answers_keyboard(QUESTION_ID, 6, []),
+        "keyboard_two_picked": lambda: generate_answers_keyboard(QUESTION_ID, 6, [4, 1]),
+        # Текст вопроса в send_question: порядок ответов + рендеринг шаблона
+        "answer_order": lambda: answer_order(6, SEED, QUESTION_ID),
+        "question_text_cached": lambda: template.render(answer_order(len(answers), SEED, QUESTION_ID)),
+        "question_text_new_seed": lambda: template.render(answer_order(len(answers), next(seeds), QUESTION_ID)),
+        "question_text_join": lambda: template._render(order),
+        # callback_answer_handler: поиск ответов вопроса и начисление баллов
+        "get_answers": lambda: gender_content.answers_by_question.get(QUESTION_ID, ()),
+        "click_resolve": click_resolve,
+        "score_update": lambda: add_pick(scores, picked_archetype, 2),
+        # show_results_handler: ранжирование архетипов и топ-3
+        "rank_top3": lambda: rank_archetypes(scores)[:3],
+        # Полная пересборка индексов контента после обновления листов
+        "build_content": lambda: build_content(values),
+    }
+
+
+def measure(func: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> float:
+    """Лучшее время одного вызова в наносекундах"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def run(selected=None, repeat: int = 5) -> Dict[str, float]:
+    results = {}
+    for name, func in build_benchmarks().items():
+        if selected and name not in selected:
+            continue
+        results[name] = round(measure(func, repeat=repeat), 1)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> list:
+    """Список регрессий: (имя, baseline, текущее, отношение)"""
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference and value / reference > 1 + tolerance:
+            regressions.append((name, reference, value, value / reference))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячего пути викторины")
+    parser.add_argument("names", nargs="*", help="запустить только указанные замеры")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="сохранить результаты как baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="допустимое замедление относительно baseline (0.5 = 50%%)")
+    parser.add_argument("--repeat", type=int, default=5, help="число повторов каждого замера")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    results = run(args.names, repeat=args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "ns_per_call": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"Baseline сохранен в {args.baseline}")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("ns_per_call", {})
+
+    print(f"{'замер':<24}{'нс/вызов':>14}{'baseline':>14}{'отношение':>12}")
+    for name, value in results.items():
+        reference = baseline.get(name)
+        ratio = f"{value / reference:.2f}" if reference else "—"
+        print(f"{name:<24}{value:>14.1f}{(reference or 0):>14.1f}{ratio:>12}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, reference, value, ratio in regressions:
+        print(f"РЕГРЕССИЯ {name}: {reference:.1f} -> {value:.1f} нс ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
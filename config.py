@@ -30,4 +30,88 @@ if not SPREADSHEET_KEY:
     logging.error("❌ SPREADSHEET_KEY не указан в переменных окружения")
     logging.error("   Укажите ID объединенной таблицы в переменной SPREADSHEET_KEY")
 else:
-    logging.info(f"✅ Используется объединенная таблица: {SPREADSHEET_KEY}")
\ No newline at end of file
+    logging.info(f"✅ Используется объединенная таблица: {SPREADSHEET_KEY}")
+# Источник контента: sheets (живая таблица, по умолчанию), file (каталог с листами
+# в CSV/JSON) или sqlite (файл SQLite). Для file и sqlite путь задается CONTENT_PATH;
+# локальную копию можно выгрузить из таблицы скриптом export_content.py
+CONTENT_BACKEND = os.getenv("CONTENT_BACKEND", "sheets")
+CONTENT_PATH = os.getenv("CONTENT_PATH")
+
+# Размер пула потоков для синхронных запросов к Google Sheets
+SHEETS_MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+# Лимит запросов к Google Sheets API в минуту (квота чтения - 60 в минуту на пользователя,
+# сервисный аккаунт считается одним пользователем) и допустимый всплеск запросов
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv("SHEETS_REQUESTS_PER_MINUTE", "60"))
+SHEETS_REQUESTS_BURST = float(os.getenv("SHEETS_REQUESTS_BURST", "10"))
+
+# Интервалы фонового обновления листов (секунды). После интервала бот продолжает
+# отдавать прежние данные, пока лист обновляется в фоне
+SHEETS_REFRESH_CONFIG = float(os.getenv("SHEETS_REFRESH_CONFIG", "300"))
+SHEETS_REFRESH_QUESTIONS = float(os.getenv("SHEETS_REFRESH_QUESTIONS", "300"))
+SHEETS_REFRESH_ANSWERS = float(os.getenv("SHEETS_REFRESH_ANSWERS", "300"))
+SHEETS_REFRESH_ARCHETYPES = float(os.getenv("SHEETS_REFRESH_ARCHETYPES", "3600"))
+# Интервал проверки изменений источника контента в секундах (0 - не проверять).
+# Для Google Sheets это один запрос времени изменения к Drive API; листы загружаются
+# только после изменения, а пока изменений нет, плановые обновления не выполняются
+CONTENT_WATCH_INTERVAL = float(os.getenv("CONTENT_WATCH_INTERVAL", "10"))
+
+# Локальный снимок контента (Config и листы обоих полов) для быстрого старта и работы
+# при недоступности Google Sheets. Пустое значение отключает снимок
+CONTENT_SNAPSHOT_PATH = os.getenv("CONTENT_SNAPSHOT_PATH", "content_snapshot.json.gz")
+
+# FSM-хранилище состояний пользователей: sqlite (по умолчанию, переживает перезапуск),
+# redis (любой Redis-совместимый сервер по FSM_REDIS_URL) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "fsm.sqlite3")
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL")
+# Как часто изменения состояний сбрасываются на диск одной транзакцией (секунды)
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес бота; без него webhook-сервер работает локально без регистрации в Telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+# Максимум одновременно обрабатываемых апдейтов в webhook-режиме
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+
+# Лимиты исходящих запросов к Bot API: запросов в секунду на всего бота,
+# минимальный интервал между отправками в один чат и число повторов после 429
+SEND_RATE = float(os.getenv("SEND_RATE", "25"))
+SEND_PER_CHAT_INTERVAL = float(os.getenv("SEND_PER_CHAT_INTERVAL", "0.5"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+# Окно (с), в котором нажатия на варианты ответа объединяются в одну правку клавиатуры (0 - без задержки)
+ANSWER_EDIT_DEBOUNCE = float(os.getenv("ANSWER_EDIT_DEBOUNCE", "0.4"))
+# Переход к следующему вопросу: resend - удалить сообщение и отправить новое,
+# edit - заменить текст и клавиатуру в том же сообщении (при ошибке - отправить новое)
+QUESTION_TRANSITION_MODE = os.getenv("QUESTION_TRANSITION_MODE", "resend").lower()
+
+# Запись результатов прохождения теста в лист Results: строки копятся в памяти и
+# дописываются одним запросом раз в RESULTS_FLUSH_INTERVAL секунд или по RESULTS_BATCH_SIZE строк
+RESULTS_ENABLED = os.getenv("RESULTS_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULTS_SHEET = os.getenv("RESULTS_SHEET", "Results")
+RESULTS_FLUSH_INTERVAL = float(os.getenv("RESULTS_FLUSH_INTERVAL", "10"))
+RESULTS_BATCH_SIZE = int(os.getenv("RESULTS_BATCH_SIZE", "50"))
+
+# ID пользователей Telegram через запятую, которым доступны служебные команды (/funnel)
+ADMIN_IDS = frozenset(int(value) for value in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if value)
+
+# Счетчики воронки периодически сохраняются в локальный файл и переживают перезапуск.
+# Пустое значение отключает сохранение
+FUNNEL_SNAPSHOT_PATH = os.getenv("FUNNEL_SNAPSHOT_PATH", "funnel.json")
+FUNNEL_SNAPSHOT_INTERVAL = float(os.getenv("FUNNEL_SNAPSHOT_INTERVAL", "60"))
+
+# HTTP-эндпоинт /metrics в формате Prometheus (задержки хендлеров, Google Sheets, Bot API,
+# кэш и очереди). METRICS_PORT=0 отключает эндпоинт
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Число процессов-воркеров. При BOT_WORKERS > 1 один процесс получает апдейты (polling или
+# webhook) и раздает их воркерам по ID чата; воркеры используют общее FSM-хранилище
+# (sqlite или redis) и общий снимок контента
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# Максимум одновременно обрабатываемых апдейтов в одном воркере
+WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", "100"))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Выгрузка контента викторины (Config и листы обоих полов) из Google-таблицы
+в локальный источник для CONTENT_BACKEND=file или CONTENT_BACKEND=sqlite.
+
+Примеры:
+    python export_content.py --to file --path content/
+    python export_content.py --to sqlite --path content.sqlite3
+"""
+import argparse
+import logging
+import os
+import sys
+
+from app.backends import FileBackend, SQLiteBackend, content_backend_factory
+from app.content import build_content, content_sheet_names
+from config import GOOGLE_CREDENTIALS_JSON, GOOGLE_CREDENTIALS_PATH, SPREADSHEET_KEY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка контента из Google-таблицы в локальный источник")
+    parser.add_argument("--to", required=True, choices=("file", "sqlite"), help="формат локального источника")
+    parser.add_argument("--path", required=True, help="каталог (file) или файл базы (sqlite)")
+    parser.add_argument("--format", default="csv", choices=("csv", "json"), help="формат файлов для --to file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    source = content_backend_factory(
+        "sheets",
+        credentials_path=GOOGLE_CREDENTIALS_PATH,
+        credentials_json=GOOGLE_CREDENTIALS_JSON,
+        spreadsheet_key=SPREADSHEET_KEY,
+    )()
+    values = source.fetch_values(content_sheet_names())
+
+    # Проверяем, что выгруженные листы разбираются так же, как в боте
+    content = build_content(values)
+    for gender, gender_content in content.by_gender.items():
+        print(f"{gender}: вопросов {len(gender_content.questions)}, ответов {len(gender_content.answers)}, "
+              f"архетипов {len(gender_content.archetype_list)}")
+
+    if args.to == "file":
+        os.makedirs(args.path, exist_ok=True)
+        target = FileBackend(args.path, export_format=args.format)
+    else:
+        target = SQLiteBackend(args.path)
+    target.write_values(values)
+    print(f"✅ Выгружено листов: {len(values)} -> {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,234 @@
-
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
-from app.handlers import router
+import secrets
+from typing import Optional, Tuple
+from aiogram import Bot, Dispatcher, Router
+from config import (
+    BOT_TOKEN, FSM_STORAGE, FSM_SQLITE_PATH, FSM_REDIS_URL, FSM_FLUSH_INTERVAL,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONCURRENCY,
+    SEND_RATE, SEND_PER_CHAT_INTERVAL, SEND_MAX_RETRIES, METRICS_HOST, METRICS_PORT,
+    FUNNEL_SNAPSHOT_PATH, BOT_WORKERS, WORKER_MAX_CONCURRENCY, SHEETS_REQUESTS_PER_MINUTE,
+    CONTENT_SNAPSHOT_PATH,
+)
+from app.handlers import (
+    router, global_db, results_recorder, funnel_counters, funnel_snapshotter, markup_debouncer, delivery,
+    sheets_quota,
+)
+from app.results import ResultsForwarder, ResultsIntake
+from app.metrics import (
+    REGISTRY, BotApiMetricsMiddleware, HandlerNameMiddleware, UpdateMetricsMiddleware,
+    start_metrics_server, stats_collector,
+)
+from app.sequencing import ChatEventIsolation
+from app.storage import create_storage
+from app.throttling import FloodControlMiddleware, SendScheduler
+from app.webhook import run_webhook
+from app.workers import ShardedDispatcher, poll_updates, worker_file_path
+
+
+def resolve_webhook_secret() -> Optional[str]:
+    """Секрет webhook; публичный webhook без WEBHOOK_SECRET получает случайный секрет.
+
+    Иначе любой мог бы присылать поддельные апдейты. Без секрета работает только
+    локальный режим без регистрации в Telegram.
+    """
+    if WEBHOOK_SECRET or not WEBHOOK_URL:
+        return WEBHOOK_SECRET
+    logging.warning("WEBHOOK_SECRET не задан: webhook регистрируется со случайным секретом")
+    return secrets.token_urlsafe(32)
+
+
+async def setup_webhook(bot: Bot, dp: Router, secret_token: Optional[str]) -> bool:
+    """Регистрирует webhook в Telegram. Без WEBHOOK_URL сервер работает локально без регистрации"""
+    if not WEBHOOK_URL:
+        logging.warning("WEBHOOK_URL не указан: webhook не регистрируется в Telegram (локальный режим)")
+        return True
+    try:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        print(f"✅ Webhook зарегистрирован: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        return True
+    except Exception as e:
+        logging.error(f"Не удалось зарегистрировать webhook: {e}")
+        return False
+
+
+def create_app(worker_index: Optional[int] = None, workers: int = 1, results_queue=None) -> Tuple[Bot, Dispatcher]:
+    """Создает Bot и Dispatcher; в режиме воркеров лимит отправок делится между процессами"""
+    bot = Bot(token=BOT_TOKEN)
+    # Все исходящие запросы проходят через планировщик с учетом лимитов Telegram
+    send_scheduler = SendScheduler(rate=SEND_RATE / workers, per_chat_interval=SEND_PER_CHAT_INTERVAL)
+    bot.session.middleware(FloodControlMiddleware(send_scheduler, max_retries=SEND_MAX_RETRIES))
+    # Регистрируется после планировщика, чтобы измерять сам запрос без ожидания в очереди
+    bot.session.middleware(BotApiMetricsMiddleware())
+    storage = create_storage(FSM_STORAGE, FSM_SQLITE_PATH, FSM_REDIS_URL, FSM_FLUSH_INTERVAL)
+    # Апдейты одного чата обрабатываются по очереди, разных чатов - параллельно
+    events_isolation = ChatEventIsolation()
+    dp = Dispatcher(storage=storage, events_isolation=events_isolation)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    router.message.middleware(HandlerNameMiddleware())
+    router.callback_query.middleware(HandlerNameMiddleware())
+    dp.include_router(router)
+
+    REGISTRY.register_collector(stats_collector(
+        'sheets_cache', global_db.cache.stats, 'Кэш листов Google Sheets',
+        counters=('hits', 'misses', 'refreshes', 'refresh_errors')))
+    REGISTRY.register_collector(stats_collector(
+        'content_watch', global_db.watch_stats, 'Проверки изменений источника контента',
+        counters=('checks', 'reloads')))
+    REGISTRY.register_collector(stats_collector(
+        'sheets_quota', sheets_quota.stats, 'Квота запросов к Google Sheets API',
+        counters=('requests', 'throttled', 'throttle_seconds', 'retries', 'errors')))
+    REGISTRY.register_collector(stats_collector(
+        'send_scheduler', send_scheduler.stats, 'Планировщик исходящих запросов',
+        counters=('throttled', 'retries')))
+    REGISTRY.register_collector(stats_collector(
+        'results', results_recorder.stats, 'Запись результатов в таблицу',
+        counters=('written', 'dropped')))
+    REGISTRY.register_collector(stats_collector(
+        'answer_markup', markup_debouncer.stats, 'Правки клавиатуры вопросов',
+        counters=('scheduled', 'coalesced', 'skipped', 'edits', 'errors')))
+    REGISTRY.register_collector(stats_collector(
+        'delivery', delivery.stats, 'Фоновая доставка последовательностей сообщений',
+        counters=('delivered', 'cancelled', 'failed')))
+    REGISTRY.register_collector(stats_collector(
+        'chat_isolation', events_isolation.stats, 'Очередь апдейтов по чатам',
+        counters=('waited',)))
+    REGISTRY.register_collector(funnel_counters.collect)
+
+    if worker_index is not None:
+        setup_worker_content(dp, worker_index, workers, results_queue)
+        # Каждый воркер сохраняет счетчики воронки в свой файл (/funnel суммирует файлы всех
+        # воркеров) и отдает метрики на своем порту
+        funnel_snapshotter.set_worker(worker_index, workers, [
+            worker_file_path(FUNNEL_SNAPSHOT_PATH, index) for index in range(workers)
+        ] if FUNNEL_SNAPSHOT_PATH else [])
+        if METRICS_PORT:
+            metrics_port = METRICS_PORT + 1 + worker_index
+
+            async def start_worker_metrics():
+                dp['metrics_runner'] = await start_metrics_server(METRICS_HOST, metrics_port)
+
+            async def stop_worker_metrics():
+                await dp['metrics_runner'].cleanup()
+
+            dp.startup.register(start_worker_metrics)
+            dp.shutdown.register(stop_worker_metrics)
+    return bot, dp
+
+
+def setup_worker_content(dp: Dispatcher, worker_index: int, workers: int, results_queue):
+    """Режим воркеров: к Google Sheets обращается только воркер 0.
+
+    Он прогревает и отслеживает контент, сохраняет снимок и записывает результаты всех
+    воркеров. Остальные воркеры читают снимок (и перечитывают его после изменения), а
+    результаты передают воркеру 0 через results_queue.
+    """
+    if not CONTENT_SNAPSHOT_PATH:
+        # Без снимка каждый воркер загружает контент сам, квота Google Sheets общая для всех
+        logging.warning("CONTENT_SNAPSHOT_PATH не задан: каждый воркер загружает контент сам")
+        sheets_quota.set_limit(SHEETS_REQUESTS_PER_MINUTE / workers)
+        return
+    if worker_index == 0:
+        intake = ResultsIntake(results_queue, results_recorder, senders=workers - 1)
+
+        async def start_results_intake():
+            intake.start()
+
+        # Shutdown-хуки диспетчера выполняются до хуков router, который останавливает ResultsRecorder
+        dp.startup.register(start_results_intake)
+        dp.shutdown.register(intake.stop)
+        return
+    global_db.follow_snapshot()
+    forwarder = ResultsForwarder(results_queue, worker_index)
+    results_recorder.set_writer(forwarder)
+
+    async def finish_results():
+        await results_recorder.stop()
+        forwarder.close()
+
+    dp.shutdown.register(finish_results)
+
 
 async def main():
     print("🚀 Запуск Telegram бота...")
+    bot, dp = create_app()
+    print("✅ Бот создан, диспетчер настроен")
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    try:
+        await run_bot(bot, dp)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+async def run_ingress(workers: ShardedDispatcher):
+    """Процесс-приемник: получает апдейты (webhook или polling) и передает их воркерам"""
     bot = Bot(token=BOT_TOKEN)
-    print("✅ Бот создан")
-    dp = Dispatcher()
-    dp.include_router(router)
-    print("✅ Диспетчер настроен")
+    bot.session.middleware(BotApiMetricsMiddleware())
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    try:
+        if BOT_MODE == "webhook":
+            secret_token = resolve_webhook_secret()
+            if await setup_webhook(bot, router, secret_token):
+                print("🌐 Запуск webhook-сервера (приемник)...")
+                await run_webhook(
+                    None, bot,
+                    host=WEBHOOK_HOST,
+                    port=WEBHOOK_PORT,
+                    path=WEBHOOK_PATH,
+                    secret_token=secret_token,
+                    forward=workers.submit,
+                )
+                return
+            print("⚠️ Webhook недоступен, переключаемся на polling")
+
+        print("🔄 Запуск polling (приемник)...")
+        await bot.delete_webhook()
+        await poll_updates(bot, workers.submit, allowed_updates=router.resolve_used_update_types())
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+
+def run_workers():
+    print(f"🧩 Режим воркеров: {BOT_WORKERS} процессов")
+    if FSM_STORAGE == "memory":
+        logging.warning("FSM_STORAGE=memory: состояние пользователей не переживет перезапуск воркера")
+    workers = ShardedDispatcher(BOT_WORKERS, create_app, max_concurrency=WORKER_MAX_CONCURRENCY)
+    workers.start()
+    try:
+        asyncio.run(run_ingress(workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        workers.stop()
+
+
+async def run_bot(bot: Bot, dp: Dispatcher):
+    """Получает апдейты через webhook или polling в зависимости от BOT_MODE"""
+    if BOT_MODE == "webhook":
+        secret_token = resolve_webhook_secret()
+        if await setup_webhook(bot, dp, secret_token):
+            print("🌐 Запуск webhook-сервера...")
+            await run_webhook(
+                dp, bot,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret_token=secret_token,
+                max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+            )
+            return
+        print("⚠️ Webhook недоступен, переключаемся на polling")
+
     print("🔄 Запуск polling...")
+    # getUpdates не работает, пока у бота зарегистрирован webhook
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
@@ -20,4 +236,7 @@ if __name__ == "__main__":
     print("🎯 ЗАПУСК TYPES OF MAGIC BOT")
     print("=" * 50)
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(main())
+    if BOT_WORKERS > 1:
+        run_workers()
+    else:
+        asyncio.run(main())
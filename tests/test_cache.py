@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.cache import StaleWhileRevalidateCache
+
+
+class CountingLoader:
+    """Loader кэша, который считает вызовы и отдает заданные значения"""
+
+    def __init__(self, values, delay=0.01):
+        self.values = values
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, keys):
+        self.calls.append(keys)
+        await asyncio.sleep(self.delay)
+        return {key: self.values[key] for key in keys}
+
+
+def test_concurrent_misses_share_one_load():
+    loader = CountingLoader({"Config": [["a"]], "Questions": [["q"]]})
+    cache = StaleWhileRevalidateCache(loader, {})
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_many(("Config", "Questions")) for _ in range(10)))
+
+    results = asyncio.run(scenario())
+
+    assert loader.calls == [("Config", "Questions")]
+    assert all(result == {"Config": [["a"]], "Questions": [["q"]]} for result in results)
+    assert cache.misses == 20
+
+
+def test_overlapping_misses_load_only_missing_keys():
+    loader = CountingLoader({"Config": [["a"]], "Questions": [["q"]]})
+    cache = StaleWhileRevalidateCache(loader, {})
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_many(("Config",)))
+        await asyncio.sleep(0)
+        second = await cache.get_many(("Config", "Questions"))
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert loader.calls == [("Config",), ("Questions",)]
+    assert first == {"Config": [["a"]]}
+    assert second == {"Config": [["a"]], "Questions": [["q"]]}
+
+
+def test_failed_load_reaches_every_waiter_and_is_retried():
+    attempts = []
+
+    async def loader(keys):
+        attempts.append(keys)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("quota exceeded")
+        return {key: [[key]] for key in keys}
+
+    cache = StaleWhileRevalidateCache(loader, {})
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_many(("Config",)) for _ in range(3)), return_exceptions=True)
+        return results, await cache.get_many(("Config",))
+
+    results, retried = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(attempts) == 2
+    assert retried == {"Config": [["Config"]]}
+
+
+def test_refresh_with_identical_data_keeps_version():
+    loader = CountingLoader({"Config": [["a"]]}, delay=0)
+    cache = StaleWhileRevalidateCache(loader, {"Config": 0})
+
+    async def scenario():
+        await cache.get_many(("Config",))
+        version = cache.version
+        # Интервал 0: значение сразу устаревает и обновляется в фоне
+        await cache.get_many(("Config",))
+        await asyncio.gather(*cache._tasks)
+        return version
+
+    version = asyncio.run(scenario())
+
+    assert len(loader.calls) == 2
+    assert cache.refreshes == 1
+    assert cache.version == version
+
+
+def test_refresh_with_new_data_bumps_version():
+    loader = CountingLoader({"Config": [["a"]]}, delay=0)
+    cache = StaleWhileRevalidateCache(loader, {"Config": 0})
+
+    async def scenario():
+        await cache.get_many(("Config",))
+        version = cache.version
+        loader.values = {"Config": [["b"]]}
+        # Пока идет обновление, отдается прежнее значение
+        stale = await cache.get_many(("Config",))
+        await asyncio.gather(*cache._tasks)
+        return version, stale, await cache.get_many(("Config",))
+
+    version, stale, fresh = asyncio.run(scenario())
+
+    assert stale == {"Config": [["a"]]}
+    assert fresh == {"Config": [["b"]]}
+    assert cache.version == version + 1
+    assert cache.loaded_version == cache.version
+
+
+@pytest.mark.parametrize("values, changed", [({"Config": [["a"]]}, False), ({"Config": [["b"]]}, True)])
+def test_put_reports_changes(values, changed):
+    cache = StaleWhileRevalidateCache(CountingLoader({}), {})
+    cache.put({"Config": [["a"]]})
+    version = cache.version
+
+    assert cache.put(values) is changed
+    assert cache.version == version + changed
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.debounce import MarkupDebouncer
+
+
+class FakeMessage:
+    """Сообщение с кнопками: запоминает правки клавиатуры"""
+
+    def __init__(self, chat_id=1, message_id=100, fail=False):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.message_id = message_id
+        self.fail = fail
+        self.edits = []
+
+    async def edit_reply_markup(self, reply_markup=None):
+        if self.fail:
+            raise RuntimeError("message is not modified")
+        self.edits.append(reply_markup)
+
+
+def test_rapid_changes_become_one_edit():
+    debouncer = MarkupDebouncer(window=0.05)
+    message = FakeMessage()
+
+    async def scenario():
+        for markup in ("one", "two", "three"):
+            await debouncer.schedule(message, markup)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert message.edits == ["three"]
+    assert debouncer.stats()["coalesced"] == 2
+    assert debouncer.stats()["pending"] == 0
+
+
+def test_messages_are_debounced_separately():
+    debouncer = MarkupDebouncer(window=0.05)
+    first, second = FakeMessage(message_id=1), FakeMessage(message_id=2)
+
+    async def scenario():
+        await debouncer.schedule(first, "a")
+        await debouncer.schedule(second, "b")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert (first.edits, second.edits) == (["a"], ["b"])
+
+
+def test_cancel_skips_pending_edit():
+    debouncer = MarkupDebouncer(window=0.05)
+    message = FakeMessage()
+
+    async def scenario():
+        await debouncer.schedule(message, "one")
+        debouncer.cancel(message)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert message.edits == []
+    assert debouncer.stats()["skipped"] == 1
+
+
+def test_flush_edits_at_once():
+    debouncer = MarkupDebouncer(window=10)
+    message = FakeMessage()
+
+    async def scenario():
+        await debouncer.schedule(message, "one")
+        await debouncer.flush(message)
+        await debouncer.flush(message, "final")
+
+    asyncio.run(scenario())
+
+    assert message.edits == ["one", "final"]
+    assert debouncer.stats()["pending"] == 0
+
+
+def test_flush_without_pending_edit_does_nothing():
+    debouncer = MarkupDebouncer(window=10)
+    message = FakeMessage()
+
+    asyncio.run(debouncer.flush(message))
+
+    assert message.edits == []
+
+
+def test_stop_applies_pending_edits():
+    debouncer = MarkupDebouncer(window=10)
+    message = FakeMessage()
+
+    async def scenario():
+        await debouncer.schedule(message, "one")
+        await debouncer.stop()
+
+    asyncio.run(scenario())
+
+    assert message.edits == ["one"]
+
+
+def test_zero_window_edits_immediately():
+    debouncer = MarkupDebouncer(window=0)
+    message = FakeMessage()
+
+    async def scenario():
+        await debouncer.schedule(message, "one")
+        await debouncer.schedule(message, "two")
+
+    asyncio.run(scenario())
+
+    assert message.edits == ["one", "two"]
+
+
+def test_failed_edit_is_counted():
+    debouncer = MarkupDebouncer(window=0)
+
+    asyncio.run(debouncer.schedule(FakeMessage(fail=True), "one"))
+
+    assert debouncer.stats()["errors"] == 1
@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.delivery import DeliveryScheduler, ScheduledMessage
+
+
+class FakeMessage:
+    """Сообщение чата: ответы записываются в общий журнал"""
+
+    def __init__(self, chat_id, log, fail_on=None):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.log = log
+        self.fail_on = fail_on
+
+    async def answer(self, text, parse_mode=None, reply_markup=None):
+        if text == self.fail_on:
+            raise RuntimeError("bot was blocked by the user")
+        self.log.append((self.chat.id, text))
+
+
+def test_sequences_of_one_chat_are_delivered_in_order():
+    scheduler = DeliveryScheduler()
+    log = []
+    message = FakeMessage(1, log)
+
+    async def scenario():
+        scheduler.submit(message, [ScheduledMessage("a1"), ScheduledMessage("a2", delay=0.03)])
+        scheduler.submit(message, [ScheduledMessage("b1")])
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+    assert log == [(1, "a1"), (1, "a2"), (1, "b1")]
+    assert scheduler.stats() == {"active_chats": 0, "delivered": 3, "cancelled": 0, "failed": 0}
+
+
+def test_chats_do_not_wait_for_each_other():
+    scheduler = DeliveryScheduler()
+    log = []
+
+    async def scenario():
+        scheduler.submit(FakeMessage(1, log), [ScheduledMessage("slow", delay=0.05)])
+        scheduler.submit(FakeMessage(2, log), [ScheduledMessage("fast")])
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+    assert log == [(2, "fast"), (1, "slow")]
+
+
+def test_submit_returns_before_pauses():
+    scheduler = DeliveryScheduler()
+    log = []
+
+    async def scenario():
+        scheduler.submit(FakeMessage(1, log), [ScheduledMessage("later", delay=0.05)])
+        sent_at_submit = list(log)
+        await scheduler.stop()
+        return sent_at_submit
+
+    assert asyncio.run(scenario()) == []
+    assert log == [(1, "later")]
+
+
+def test_cancel_drops_undelivered_messages_of_the_chat():
+    scheduler = DeliveryScheduler()
+    log = []
+    message = FakeMessage(1, log)
+
+    async def scenario():
+        scheduler.submit(message, [ScheduledMessage("a1"), ScheduledMessage("a2", delay=0.05)])
+        scheduler.submit(message, [ScheduledMessage("b1")])
+        await asyncio.sleep(0.01)
+        cancelled = scheduler.cancel(1)
+        # Новая последовательность после отмены (повторный /start) не ждет отмененные
+        scheduler.submit(message, [ScheduledMessage("restart")])
+        await scheduler.stop()
+        return cancelled
+
+    assert asyncio.run(scenario()) is True
+    assert log == [(1, "a1"), (1, "restart")]
+    assert scheduler.stats()["cancelled"] == 2
+
+
+def test_cancel_without_sequence():
+    assert DeliveryScheduler().cancel(1) is False
+
+
+def test_failed_send_stops_only_its_sequence():
+    scheduler = DeliveryScheduler()
+    log = []
+    message = FakeMessage(1, log, fail_on="broken")
+
+    async def scenario():
+        scheduler.submit(message, [ScheduledMessage("broken"), ScheduledMessage("skipped")])
+        scheduler.submit(message, [ScheduledMessage("next")])
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+    assert log == [(1, "next")]
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_stop_cancels_sequences_after_timeout():
+    scheduler = DeliveryScheduler()
+    log = []
+
+    async def scenario():
+        scheduler.submit(FakeMessage(1, log), [ScheduledMessage("never", delay=10)])
+        await scheduler.stop(timeout=0.05)
+
+    asyncio.run(scenario())
+
+    assert log == []
+    assert scheduler.stats()["cancelled"] == 1
@@ -0,0 +1,122 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from app.results import RESULTS_HEADER, ResultsRecorder, result_row
+
+RANKED = [("hero", 9), ("sage", 6), ("lover", 3), ("rebel", 0)]
+
+
+class RecordingWriter:
+    """Writer, который запоминает пакеты строк и может падать заданное число раз"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def __call__(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Sheets unavailable")
+        self.batches.append(rows)
+
+
+def test_result_row_layout():
+    timestamp = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+    row = result_row(42, "female", RANKED, timestamp)
+
+    assert len(row) == len(RESULTS_HEADER)
+    assert row[:6] == ["2024-05-01T12:30:00+00:00", 42, "female", "hero", "sage", "lover"]
+    assert json.loads(row[6]) == {"hero": 9, "sage": 6, "lover": 3, "rebel": 0}
+
+
+def test_short_ranking_is_padded():
+    assert result_row(1, "male", [("hero", 3)])[3:6] == ["hero", "", ""]
+
+
+def test_flush_writes_buffer_in_one_batch():
+    writer = RecordingWriter()
+    recorder = ResultsRecorder(writer)
+    for user_id in range(3):
+        recorder.record(user_id, "male", RANKED)
+
+    assert asyncio.run(recorder.flush()) is True
+    assert [[row[1] for row in batch] for batch in writer.batches] == [[0, 1, 2]]
+    assert recorder.stats()["written"] == 3
+
+
+def test_failed_write_keeps_rows_in_order():
+    writer = RecordingWriter(failures=1)
+    recorder = ResultsRecorder(writer)
+
+    async def scenario():
+        recorder.record(1, "male", RANKED)
+        assert await recorder.flush() is False
+        # Строка, записанная после ошибки, идет после возвращенных в буфер
+        recorder.record(2, "male", RANKED)
+        return await recorder.flush()
+
+    assert asyncio.run(scenario()) is True
+    assert [[row[1] for row in batch] for batch in writer.batches] == [[1, 2]]
+    assert recorder.stats()["failures"] == 0
+
+
+def test_full_buffer_drops_oldest_rows():
+    writer = RecordingWriter()
+    recorder = ResultsRecorder(writer, max_buffered=2)
+    for user_id in range(3):
+        recorder.record(user_id, "male", RANKED)
+
+    asyncio.run(recorder.flush())
+
+    assert [row[1] for row in writer.batches[0]] == [1, 2]
+    assert recorder.stats()["dropped"] == 1
+
+
+def test_full_batch_wakes_background_writer():
+    writer = RecordingWriter()
+    recorder = ResultsRecorder(writer, flush_interval=60, batch_size=2)
+
+    async def scenario():
+        recorder.start()
+        recorder.record(1, "male", RANKED)
+        await asyncio.sleep(0.05)
+        assert writer.batches == []
+        recorder.record(2, "male", RANKED)
+        await asyncio.sleep(0.05)
+        await recorder.stop()
+
+    asyncio.run(scenario())
+
+    assert [[row[1] for row in batch] for batch in writer.batches] == [[1, 2]]
+
+
+def test_stop_flushes_remaining_rows():
+    writer = RecordingWriter()
+    recorder = ResultsRecorder(writer, flush_interval=60)
+
+    async def scenario():
+        recorder.start()
+        recorder.record(1, "female", RANKED)
+        await recorder.stop()
+
+    asyncio.run(scenario())
+
+    assert len(writer.batches) == 1
+    assert recorder.stats()["buffered"] == 0
+
+
+def test_background_writer_retries_after_failure():
+    writer = RecordingWriter(failures=1)
+    recorder = ResultsRecorder(writer, flush_interval=0.01, retry_delay=0.01)
+
+    async def scenario():
+        recorder.start()
+        recorder.record(1, "male", RANKED)
+        await asyncio.sleep(0.2)
+        await recorder.stop()
+
+    asyncio.run(scenario())
+
+    assert [[row[1] for row in batch] for batch in writer.batches] == [[1]]
@@ -0,0 +1,109 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app import delivery as delivery_module, handlers
+from app.async_db import AsyncSheetsDB
+from app.sequencing import ChatEventIsolation, KeyedLocks, update_chat_id
+from bench.fake_bot_api import FakeBotAPI
+from bench.fixtures import FakeSheetsDB
+from bench.loadtest import BOT_TOKEN, UpdateFactory, _NoPauses
+
+
+def test_keyed_locks_keep_order_per_key():
+    locks = KeyedLocks()
+    events = []
+
+    async def work(key, name, delay):
+        async with locks.lock(key):
+            events.append(f"{name}+")
+            await asyncio.sleep(delay)
+            events.append(f"{name}-")
+
+    async def scenario():
+        await asyncio.gather(work(1, "a1", 0.03), work(1, "a2", 0), work(2, "b1", 0.01))
+
+    asyncio.run(scenario())
+
+    # Апдейты одного чата не пересекаются, другой чат не ждет
+    assert events.index("a1-") < events.index("a2+")
+    assert events.index("b1+") < events.index("a1-")
+    assert locks.stats() == {"active_chats": 0, "queued_updates": 0, "waited": 1}
+
+
+def test_keyed_locks_skip_none_key():
+    locks = KeyedLocks()
+
+    async def scenario():
+        async with locks.lock(None):
+            async with locks.lock(None):
+                return locks.stats()["active_chats"]
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_update_chat_id():
+    message = {"update_id": 1, "message": {"chat": {"id": 10}, "from": {"id": 11}}}
+    callback = {"update_id": 2, "callback_query": {"from": {"id": 11}, "message": {"chat": {"id": 12}}}}
+    inline = {"update_id": 3, "inline_query": {"from": {"id": 13}}}
+
+    assert update_chat_id(message) == 10
+    assert update_chat_id(callback) == 12
+    assert update_chat_id(inline) == 13
+    assert update_chat_id({"update_id": 4}) is None
+
+
+def test_parse_answer_callback():
+    assert handlers.parse_answer_callback("ans_num:7:2") == (7, 2)
+    # Клавиатуры, отправленные до появления ID вопроса в callback data
+    assert handlers.parse_answer_callback("ans_num:2") == (None, 2)
+
+
+def test_stale_tap_is_not_scored_on_the_next_question(monkeypatch):
+    """Повторное нажатие на клавиатуру пройденного вопроса не засчитывается следующему"""
+    sheets = FakeSheetsDB()
+    monkeypatch.setattr(handlers, "global_db", AsyncSheetsDB(lambda: sheets, snapshot_path=None))
+    monkeypatch.setattr(handlers, "asyncio", _NoPauses())
+    monkeypatch.setattr(delivery_module, "asyncio", _NoPauses())
+
+    async def scenario():
+        fake_api = FakeBotAPI()
+        bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(await fake_api.start())))
+        dp = Dispatcher(storage=MemoryStorage(), events_isolation=ChatEventIsolation())
+        dp.include_router(handlers.router)
+        await handlers.global_db.content()
+        factory = UpdateFactory(bot)
+        try:
+            for user_id in (7, 8):
+                await dp.feed_update(bot, factory.command(user_id, "/start"))
+                for data in ("gender:female", "start_instructions", "start_quiz_now"):
+                    await dp.feed_update(bot, factory.callback(user_id, data))
+
+            taps = ("ans_num:1:1", "ans_num:1:2", "ans_num:1:3", "ans_num:1:3")
+            # Пользователь 7 нажимает по одному, пользователь 8 - все сразу (апдейты ждут блокировку чата)
+            for data in taps:
+                await dp.feed_update(bot, factory.callback(7, data))
+            await asyncio.gather(*(dp.feed_update(bot, factory.callback(8, data)) for data in taps))
+
+            return {
+                user_id: await dp.storage.get_data(StorageKey(bot.id, user_id, user_id))
+                for user_id in (7, 8)
+            }
+        finally:
+            await handlers.delivery.stop()
+            await handlers.markup_debouncer.stop()
+            await bot.session.close()
+            await fake_api.stop()
+            handlers.global_db.close()
+
+    states = asyncio.run(scenario())
+
+    for data in states.values():
+        assert data["current_question_id"] == 2
+        assert data["answered_in_question"] == []
+        assert data["click_count"] == 0
+        assert sum(data["scores"].values()) == 6
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+async def read_back(path: str):
+    storage = SQLiteStorage(path)
+    try:
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+    finally:
+        await storage.close()
+
+
+def test_close_persists_pending_changes(tmp_path):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path, flush_interval=60)
+        await storage.set_state(KEY, "Quiz:in_progress")
+        await storage.set_data(KEY, {"click_count": 1})
+        await storage.close()
+        return await read_back(path)
+
+    assert asyncio.run(scenario()) == ("Quiz:in_progress", {"click_count": 1})
+
+
+def test_write_during_flush_is_flushed_next(tmp_path):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path, flush_interval=60)
+        write = storage._write
+        writing = threading.Event()
+        release = threading.Event()
+
+        def blocking_write(rows):
+            writing.set()
+            release.wait(5)
+            write(rows)
+
+        storage._write = blocking_write
+        await storage.set_data(KEY, {"click_count": 1})
+        flush = asyncio.ensure_future(storage.flush())
+        await asyncio.get_running_loop().run_in_executor(None, writing.wait, 5)
+
+        # Изменение, сделанное во время записи, не должно потеряться
+        await storage.set_data(KEY, {"click_count": 2})
+        release.set()
+        await flush
+        assert storage._dirty
+
+        storage._write = write
+        await storage.flush()
+        assert not storage._dirty
+        await storage.close()
+        return await read_back(path)
+
+    assert asyncio.run(scenario()) == (None, {"click_count": 2})
+
+
+def test_failed_write_keeps_keys_dirty(tmp_path):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path, flush_interval=60)
+        write = storage._write
+
+        def failing_write(rows):
+            raise OSError("disk full")
+
+        storage._write = failing_write
+        await storage.set_data(KEY, {"scores": {"A": 3}})
+        await storage.flush()
+        assert storage._dirty
+
+        storage._write = write
+        await storage.close()
+        return await read_back(path)
+
+    assert asyncio.run(scenario()) == (None, {"scores": {"A": 3}})
+
+
+def test_cleared_record_is_deleted(tmp_path):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path, flush_interval=60)
+        await storage.set_state(KEY, "Quiz:in_progress")
+        await storage.flush()
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        await storage.flush()
+        rows = await storage._run(lambda: storage._open().execute("SELECT COUNT(*) FROM fsm").fetchone()[0])
+        await storage.close()
+        return rows
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, EditMessageReplyMarkup, SendMessage
+
+from app.throttling import PRIORITY_BULK, PRIORITY_INTERACTIVE, FloodControlMiddleware, SendScheduler
+
+
+def test_burst_passes_then_rate_limits():
+    scheduler = SendScheduler(rate=50, burst=5, per_chat_interval=0)
+
+    async def scenario():
+        started = time.monotonic()
+        for _ in range(10):
+            await scheduler.acquire()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+
+    # 5 запросов из запаса, еще 5 - по одному раз в 1/50 с
+    assert 0.08 <= elapsed < 0.5
+    assert scheduler.throttled == 5
+
+
+def test_interactive_requests_jump_the_queue():
+    scheduler = SendScheduler(rate=100, burst=1, per_chat_interval=0)
+    order = []
+
+    async def request(name, priority):
+        await scheduler.acquire(priority=priority)
+        order.append(name)
+
+    async def scenario():
+        await scheduler.acquire()
+        bulk = [asyncio.ensure_future(request(f"bulk{index}", PRIORITY_BULK)) for index in range(3)]
+        await asyncio.sleep(0)
+        edit = asyncio.ensure_future(request("edit", PRIORITY_INTERACTIVE))
+        await asyncio.gather(*bulk, edit)
+
+    asyncio.run(scenario())
+
+    assert order == ["edit", "bulk0", "bulk1", "bulk2"]
+
+
+def test_sends_to_one_chat_are_spaced():
+    scheduler = SendScheduler(rate=1000, per_chat_interval=0.05)
+    sent_at = {}
+
+    async def send(chat_id, index):
+        await scheduler.acquire(chat_id)
+        sent_at[chat_id, index] = time.monotonic()
+
+    async def scenario():
+        await asyncio.gather(*(send(chat_id, index) for index in range(3) for chat_id in (1, 2)))
+
+    asyncio.run(scenario())
+
+    for chat_id in (1, 2):
+        assert sent_at[chat_id, 1] - sent_at[chat_id, 0] >= 0.04
+        assert sent_at[chat_id, 2] - sent_at[chat_id, 1] >= 0.04
+    # Разные чаты друг друга не ждут
+    assert abs(sent_at[1, 0] - sent_at[2, 0]) < 0.04
+
+
+def test_pause_holds_every_request():
+    scheduler = SendScheduler(rate=1000, per_chat_interval=0)
+
+    async def scenario():
+        scheduler.pause(0.1)
+        started = time.monotonic()
+        await scheduler.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.09
+
+
+class FlakyRequest:
+    """make_request, который первые failures раз отвечает 429"""
+
+    def __init__(self, failures, retry_after=0):
+        self.failures = failures
+        self.retry_after = retry_after
+        self.calls = 0
+
+    async def __call__(self, bot, method):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        return "ok"
+
+
+def test_flood_control_retries_after_429():
+    scheduler = SendScheduler(rate=1000, per_chat_interval=0)
+    middleware = FloodControlMiddleware(scheduler, max_retries=3)
+    make_request = FlakyRequest(failures=2)
+
+    result = asyncio.run(middleware(make_request, None, SendMessage(chat_id=1, text="hi")))
+
+    assert result == "ok"
+    assert make_request.calls == 3
+    assert scheduler.retries == 2
+
+
+def test_flood_control_gives_up_after_max_retries():
+    middleware = FloodControlMiddleware(SendScheduler(rate=1000, per_chat_interval=0), max_retries=1)
+    make_request = FlakyRequest(failures=5)
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(middleware(make_request, None, SendMessage(chat_id=1, text="hi")))
+    assert make_request.calls == 2
+
+
+def test_requests_without_chat_bypass_the_scheduler():
+    scheduler = SendScheduler(rate=1, burst=1, per_chat_interval=0)
+    middleware = FloodControlMiddleware(scheduler)
+
+    async def scenario():
+        await scheduler.acquire()
+        return await asyncio.wait_for(
+            middleware(FlakyRequest(failures=0), None, AnswerCallbackQuery(callback_query_id="1")), timeout=0.5)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert scheduler.throttled == 0
+
+
+def test_edits_are_interactive():
+    scheduler = SendScheduler(rate=1000, per_chat_interval=10)
+    middleware = FloodControlMiddleware(scheduler)
+
+    async def scenario():
+        await middleware(FlakyRequest(failures=0), None, SendMessage(chat_id=1, text="hi"))
+        # Правка клавиатуры не ждет интервала чата после отправки
+        edit = EditMessageReplyMarkup(chat_id=1, message_id=5)
+        return await asyncio.wait_for(middleware(FlakyRequest(failures=0), None, edit), timeout=0.5)
+
+    assert asyncio.run(scenario()) == "ok"